@@ -0,0 +1,11 @@
+"""Offline benchmark suite for the Reddit Tracking Agent API.
+
+Run from the backend directory:
+
+    python -m benchmarks.run --sizes 1000,10000
+
+Reddit and Pushshift are replaced by a local stand-in server (fake_reddit)
+that replays recorded fixtures, or deterministic synthetic listings, with
+configurable latency and error rates; MongoDB is replaced by an in-memory
+mongomock database unless --mongo-url points at a real (local) server.
+"""
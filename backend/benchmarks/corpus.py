@@ -0,0 +1,90 @@
+"""Deterministic synthetic posts and the Reddit/Pushshift payloads built from them"""
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+
+FILLER_WORDS = (
+    "the a my and to of for with about anyone else been trying week started doctor "
+    "sleep diet energy morning routine results question advice experience months "
+    "really think feel better worse tired help data app using tried found noticed "
+    "any recommendations after before since daily weekly numbers goal plan"
+).split()
+
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _sentence(rng: random.Random, keywords: Sequence[str], words: int, keyword_rate: float) -> str:
+    tokens = [
+        rng.choice(keywords) if keywords and rng.random() < keyword_rate else rng.choice(FILLER_WORDS)
+        for _ in range(words)
+    ]
+    return " ".join(tokens)
+
+
+def synthetic_post(rng: random.Random, index: int, subreddit: str, keywords: Sequence[str],
+                   prefix: str = "bench") -> Dict[str, Any]:
+    """One post in the shape the scrapers produce (and RedditPost accepts)"""
+    post_id = f"{prefix}{index:07d}"
+    created = EPOCH + timedelta(minutes=rng.randrange(60 * 24 * 90))
+    upvotes = int(rng.paretovariate(1.2))
+    return {
+        "id": post_id,
+        "title": _sentence(rng, keywords, rng.randint(6, 14), 0.15).capitalize(),
+        "content": _sentence(rng, keywords, rng.randint(0, 180), 0.05),
+        "subreddit": subreddit,
+        "author": f"user{rng.randrange(5000)}",
+        "upvotes": upvotes,
+        "comments_count": rng.randrange(upvotes + 5),
+        "url": f"https://www.reddit.com/r/{subreddit}/comments/{post_id}/",
+        "created_at": str(created),
+        "score": upvotes,
+    }
+
+
+def synthetic_corpus(size: int, subreddits: Sequence[str], keywords: Sequence[str], seed: int = 0,
+                     prefix: str = "bench") -> List[Dict[str, Any]]:
+    """`size` posts spread over `subreddits`; the same seed always gives the same corpus"""
+    rng = random.Random(seed)
+    return [synthetic_post(rng, index, rng.choice(subreddits), keywords, prefix) for index in range(size)]
+
+
+def listing_payload(posts: Sequence[Dict[str, Any]], after: Optional[str] = None) -> Dict[str, Any]:
+    """A Reddit listing (search.json, hot.json, new.json, ...) wrapping `posts`"""
+    children = []
+    for post in posts:
+        created = datetime.fromisoformat(post["created_at"])
+        children.append({
+            "kind": "t3",
+            "data": {
+                "id": post["id"],
+                "name": f"t3_{post['id']}",
+                "title": post["title"],
+                "selftext": post["content"],
+                "subreddit": post["subreddit"],
+                "author": post["author"],
+                "ups": post["upvotes"],
+                "score": post["upvotes"],
+                "num_comments": post["comments_count"],
+                "permalink": f"/r/{post['subreddit']}/comments/{post['id']}/",
+                "created_utc": created.timestamp(),
+            },
+        })
+    return {"kind": "Listing", "data": {"after": after, "children": children}}
+
+
+def pushshift_payload(posts: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """A Pushshift submission search result wrapping `posts`"""
+    return {
+        "data": [
+            {
+                "id": post["id"],
+                "title": post["title"],
+                "selftext": post["content"],
+                "author": post["author"],
+                "score": post["upvotes"],
+                "num_comments": post["comments_count"],
+                "created_utc": int(datetime.fromisoformat(post["created_at"]).timestamp()),
+            }
+            for post in posts
+        ]
+    }
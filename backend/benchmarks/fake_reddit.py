@@ -0,0 +1,152 @@
+"""Local stand-in for Reddit and Pushshift.
+
+Serves every endpoint the scrapers call. A response comes from a recorded
+fixture (see benchmarks.record) when one exists for the endpoint and
+subreddit, otherwise from a synthetic listing seeded by the request, so
+the same request always gets the same posts. Each response is delayed by
+a normally distributed latency and fails with 503 at the configured rate.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from .corpus import listing_payload, pushshift_payload, synthetic_corpus
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+
+def fixture_path(fixtures_dir: Path, kind: str, subreddit: str) -> Path:
+    return fixtures_dir / f"{kind}__{subreddit.lower()}.json"
+
+
+def load_fixtures(fixtures_dir: Optional[Path]) -> Dict[Tuple[str, str], Any]:
+    """Recorded payloads keyed by (kind, subreddit), from files named kind__subreddit.json"""
+    fixtures = {}
+    if fixtures_dir and fixtures_dir.is_dir():
+        for path in fixtures_dir.glob("*__*.json"):
+            kind, subreddit = path.stem.split("__", 1)
+            fixtures[(kind, subreddit)] = json.loads(path.read_text())
+    return fixtures
+
+
+class FakeReddit:
+    """The stand-in's behaviour: fixtures, latency, error rates and request counts"""
+
+    def __init__(self, keywords: Sequence[str] = (), fixtures_dir: Optional[Path] = FIXTURES_DIR,
+                 latency: float = 0.05, jitter: float = 0.02, error_rate: float = 0.0,
+                 pushshift_error_rate: Optional[float] = None, seed: int = 0):
+        self.keywords = list(keywords)
+        self.fixtures = load_fixtures(fixtures_dir)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.pushshift_error_rate = error_rate if pushshift_error_rate is None else pushshift_error_rate
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.app = self._build_app()
+
+    def _synthetic_posts(self, kind: str, subreddit: str, query: str, limit: int):
+        seed = zlib.crc32(f"{self.seed}:{kind}:{subreddit}:{query}".encode())
+        keywords = self.keywords + query.split()
+        return synthetic_corpus(limit, [subreddit], keywords, seed=seed, prefix=f"{subreddit[:4].lower()}{seed % 10000:04d}")
+
+    async def respond(self, kind: str, subreddit: str, query: str = "", limit: int = 25):
+        self.requests[kind] += 1
+        await asyncio.sleep(max(0.0, self._rng.gauss(self.latency, self.jitter)))
+        error_rate = self.pushshift_error_rate if kind == "pushshift" else self.error_rate
+        if self._rng.random() < error_rate:
+            self.errors[kind] += 1
+            return JSONResponse({"message": "Service Unavailable", "error": 503}, status_code=503)
+
+        recorded = self.fixtures.get((kind, subreddit.lower()))
+        if recorded is not None:
+            return JSONResponse(recorded)
+        posts = self._synthetic_posts(kind, subreddit, query, min(limit, 100))
+        return JSONResponse(pushshift_payload(posts) if kind == "pushshift" else listing_payload(posts))
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="Fake Reddit")
+
+        def limit_of(request: Request) -> int:
+            try:
+                return int(request.query_params.get("limit") or request.query_params.get("size") or 25)
+            except ValueError:
+                return 25
+
+        @app.get("/search.json")
+        async def global_search(request: Request):
+            # q is "<query> subreddit:<name>"
+            terms = request.query_params.get("q", "").split()
+            subreddit = next((term.split(":", 1)[1] for term in terms if term.startswith("subreddit:")), "all")
+            query = " ".join(term for term in terms if not term.startswith("subreddit:"))
+            return await self.respond("global_search", subreddit, query, limit_of(request))
+
+        @app.get("/r/{subreddit}/search.json")
+        async def subreddit_search(subreddit: str, request: Request):
+            return await self.respond("search", subreddit, request.query_params.get("q", ""), limit_of(request))
+
+        @app.get("/r/{subreddit}/{listing}.json")
+        async def subreddit_listing(subreddit: str, listing: str, request: Request):
+            return await self.respond(listing, subreddit, "", limit_of(request))
+
+        @app.get("/r/{subreddit}.json")
+        async def subreddit_front(subreddit: str, request: Request):
+            return await self.respond("hot", subreddit, "", limit_of(request))
+
+        @app.get("/reddit/search/submission/")
+        async def pushshift_search(request: Request):
+            params = request.query_params
+            return await self.respond("pushshift", params.get("subreddit", "all"), params.get("q", ""), limit_of(request))
+
+        return app
+
+
+class FakeRedditServer:
+    """Serve a FakeReddit with uvicorn on a background thread (port 0 picks a free port)"""
+
+    def __init__(self, fake: FakeReddit, host: str = "127.0.0.1", port: int = 0):
+        self.fake = fake
+        self.host = host
+        self.port = port
+        self._server: Optional[uvicorn.Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self, timeout: float = 10.0):
+        config = uvicorn.Config(self.fake.app, host=self.host, port=self.port, log_level="warning", lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, name="fake-reddit", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("Fake Reddit server did not start")
+            time.sleep(0.01)
+        self.port = self._server.servers[0].sockets[0].getsockname()[1]
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=10)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,60 @@
+"""Record live Reddit/Pushshift responses as fixtures for the fake server.
+
+    python -m benchmarks.record --query "longevity" longevity QuantifiedSelf
+
+Writes kind__subreddit.json files into benchmarks/fixtures; the fake server
+replays them in place of synthetic listings. Recording is the only part of
+the suite that touches the network.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import httpx
+
+from .fake_reddit import FIXTURES_DIR, fixture_path
+
+USER_AGENT = "Mozilla/5.0 (compatible; reddit-tracking-agent-benchmarks/1.0)"
+
+
+def record_endpoints(subreddit: str, query: str, limit: int):
+    """(kind, url, params) for every endpoint the scrapers call for one subreddit"""
+    return [
+        ("search", f"https://www.reddit.com/r/{subreddit}/search.json",
+         {"q": query, "restrict_sr": 1, "sort": "relevance", "limit": limit}),
+        ("global_search", "https://www.reddit.com/search.json",
+         {"q": f"{query} subreddit:{subreddit}", "sort": "relevance", "limit": limit}),
+        ("hot", f"https://www.reddit.com/r/{subreddit}/hot.json", {"limit": limit}),
+        ("top", f"https://www.reddit.com/r/{subreddit}/top.json", {"t": "week", "limit": limit}),
+        ("new", f"https://www.reddit.com/r/{subreddit}/new.json", {"limit": limit, "raw_json": 1}),
+        ("pushshift", "https://api.pushshift.io/reddit/search/submission/",
+         {"subreddit": subreddit, "q": query, "size": limit, "sort": "score", "sort_type": "desc"}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("subreddits", nargs="+")
+    parser.add_argument("--query", default="health")
+    parser.add_argument("--limit", type=int, default=25)
+    parser.add_argument("--out", type=Path, default=FIXTURES_DIR)
+    parser.add_argument("--delay", type=float, default=2.0, help="seconds between requests")
+    args = parser.parse_args()
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    with httpx.Client(headers={"User-Agent": USER_AGENT}, timeout=15, follow_redirects=True) as client:
+        for subreddit in args.subreddits:
+            for kind, url, params in record_endpoints(subreddit, args.query, args.limit):
+                try:
+                    response = client.get(url, params=params)
+                    response.raise_for_status()
+                    fixture_path(args.out, kind, subreddit).write_text(json.dumps(response.json()))
+                    print(f"recorded {kind} for r/{subreddit}")
+                except (httpx.HTTPError, ValueError) as e:
+                    print(f"skipped {kind} for r/{subreddit}: {e}")
+                time.sleep(args.delay)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""Benchmark the API offline and report throughput and p50/p95/p99 latency.
+
+    python -m benchmarks.run                          # 1k, 10k and 100k posts
+    python -m benchmarks.run --sizes 1000 --json results.json
+    python -m benchmarks.run --baseline results.json  # exit 1 on a p95 regression
+
+For each corpus size the database is emptied, then:
+
+- analyze_post_for_eon_health   scores every post of the corpus in-process
+- POST /api/search-reddit       live searches answered by the fake server
+- POST /api/analyze-posts       the whole corpus, --analyze-batch posts a request
+- POST /api/synthesize-trends   --repeat calls each from analyses and rollups
+
+API calls go through the ASGI app in-process, inside the app lifespan, so
+the numbers cover the handlers, the scraper (on the shared connection
+pool) and the database but not the HTTP server in front of them.
+
+The default in-memory database has no indexes, so every update scans its
+collection: beyond ~1k posts the analyze/synthesize numbers mostly measure
+mongomock. Use --mongo-url mongodb://localhost:27017 for the larger corpora,
+or --storage sqlite to benchmark the embedded backend in a scratch file.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from .corpus import synthetic_corpus
+from .fake_reddit import FIXTURES_DIR, FakeReddit, FakeRedditServer
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SEARCH_QUERIES = ["longevity", "wearable data", "sleep tracking", "personalized nutrition", "biomarkers"]
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of `samples`"""
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(name: str, size: int, samples: List[float], elapsed: float, items: Optional[int] = None) -> Dict[str, Any]:
+    """One result row; latencies in milliseconds, throughput in calls (and items) per second"""
+    row = {
+        "benchmark": name,
+        "corpus_size": size,
+        "calls": len(samples),
+        "throughput": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+    if items is not None:
+        row["items_per_second"] = round(items / elapsed, 1) if elapsed else 0.0
+    return row
+
+
+def configure_environment(args: argparse.Namespace, fake_url: str):
+    """Point the server module at the stand-ins; must run before it is imported"""
+    os.environ.update({
+        "REDDIT_BASE_URL": fake_url,
+        "PUSHSHIFT_BASE_URL": fake_url,
+        # Measure the app rather than Reddit's politeness limit. Pushshift keeps
+        # its real limit: it serves from the same host here, and the numbers
+        # should show it if Reddit traffic ever lands in its bucket
+        "REDDIT_RATE_LIMIT": "100000",
+        "REDDIT_RATE_BURST": "100000",
+        "SCRAPER_MAX_REQUESTS": "100000",
+        # Every search should reach the fake server rather than the response cache
+        "SCRAPE_CACHE_TTL": "0",
+        "SCRAPE_CACHE_PERSIST": "false",
+        "CRAWLER_ENABLED": "false",
+        "DB_NAME": args.db_name,
+        "STORAGE_BACKEND": args.storage,
+    })
+    if args.storage == "sqlite":
+        os.environ["SQLITE_PATH"] = str(args.sqlite_path or Path(tempfile.mkdtemp(prefix="reddit-bench-")) / "bench.db")
+        return
+    if args.mongo_url:
+        os.environ["MONGO_URL"] = args.mongo_url
+        return
+    try:
+        import motor.motor_asyncio
+        from mongomock_motor import AsyncMongoMockClient
+    except ImportError:
+        sys.exit("The in-memory database needs mongomock-motor (pip install -r benchmarks/requirements.txt); "
+                 "or pass --mongo-url of a local MongoDB")
+    motor.motor_asyncio.AsyncIOMotorClient = lambda *args, **kwargs: AsyncMongoMockClient()
+
+
+def import_server():
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    import server
+    return server
+
+
+async def reset_database(server):
+    await server.storage.reset()
+    server.endpoint_health.clear()
+
+
+async def timed_calls(calls: List[Callable], concurrency: int = 1) -> tuple:
+    """Await each call with at most `concurrency` in flight; returns (latencies, elapsed)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    samples: List[float] = []
+
+    async def run(call):
+        async with semaphore:
+            started = time.perf_counter()
+            await call()
+            samples.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(call) for call in calls))
+    return samples, time.perf_counter() - started
+
+
+def checked(response: httpx.Response) -> httpx.Response:
+    if response.status_code != 200:
+        raise RuntimeError(f"{response.request.method} {response.request.url} -> {response.status_code}: {response.text[:200]}")
+    return response
+
+
+async def bench_analyzer(server, corpus: List[Dict], description: str) -> Dict[str, Any]:
+    profile = server.get_company_profile(description)
+    samples = []
+    started = time.perf_counter()
+    for post in corpus:
+        call_started = time.perf_counter()
+        server.analyze_post_for_eon_health(post, profile=profile)
+        samples.append(time.perf_counter() - call_started)
+    return summarize("analyze_post_for_eon_health", len(corpus), samples, time.perf_counter() - started)
+
+
+async def bench_search(api: httpx.AsyncClient, size: int, args: argparse.Namespace) -> Dict[str, Any]:
+    calls = []
+    for index in range(args.search_requests):
+        query = SEARCH_QUERIES[index % len(SEARCH_QUERIES)]
+
+        async def call(query=query):
+            checked(await api.post("/api/search-reddit", json={"query": query, "max_posts": args.search_max_posts}))
+        calls.append(call)
+    samples, elapsed = await timed_calls(calls, args.concurrency)
+    return summarize("POST /api/search-reddit", size, samples, elapsed)
+
+
+async def bench_analyze(api: httpx.AsyncClient, corpus: List[Dict], args: argparse.Namespace) -> Dict[str, Any]:
+    post_ids = [post["id"] for post in corpus]
+    calls = []
+    for start in range(0, len(post_ids), args.analyze_batch):
+        batch = post_ids[start:start + args.analyze_batch]
+
+        async def call(batch=batch):
+            checked(await api.post("/api/analyze-posts", json={"post_ids": batch, "company_description": args.description}))
+        calls.append(call)
+    samples, elapsed = await timed_calls(calls, args.concurrency)
+    return summarize("POST /api/analyze-posts", len(corpus), samples, elapsed, items=len(post_ids))
+
+
+async def bench_synthesize(api: httpx.AsyncClient, size: int, source: str, args: argparse.Namespace) -> Dict[str, Any]:
+    params = {"query": "benchmark", "min_relevance": args.min_relevance, "source": source, "days": 3650}
+
+    async def call():
+        checked(await api.post("/api/synthesize-trends", params=params))
+    samples, elapsed = await timed_calls([call] * args.repeat, args.concurrency)
+    return summarize(f"POST /api/synthesize-trends ({source})", size, samples, elapsed)
+
+
+async def run_benchmarks(server, fake: FakeReddit, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    keywords = [keyword for category in server.KEYWORD_CATEGORIES.values() for keyword in category["keywords"]]
+    fake.keywords = keywords
+    results = []
+    async with server.app.router.lifespan_context(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as api:
+            for size in args.sizes:
+                print(f"corpus of {size} posts", file=sys.stderr)
+                await reset_database(server)
+                corpus = synthetic_corpus(size, server.TARGET_SUBREDDITS, keywords, seed=args.seed)
+
+                results.append(await bench_analyzer(server, corpus, args.description))
+                await server.store_posts([server.RedditPost(**post) for post in corpus])
+                results.append(await bench_search(api, size, args))
+                results.append(await bench_analyze(api, corpus, args))
+                for source in ("analyses", "rollups"):
+                    results.append(await bench_synthesize(api, size, source, args))
+    return results
+
+
+def print_table(results: List[Dict[str, Any]]):
+    header = f"{'benchmark':<42} {'posts':>7} {'calls':>6} {'calls/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        print(f"{row['benchmark']:<42} {row['corpus_size']:>7} {row['calls']:>6} {row['throughput']:>9} "
+              f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}")
+
+
+def find_regressions(results: List[Dict], baseline: List[Dict], tolerance: float) -> List[str]:
+    """Rows whose p95 exceeds the baseline's by more than `tolerance` (a fraction)"""
+    previous = {(row["benchmark"], row["corpus_size"]): row for row in baseline}
+    regressions = []
+    for row in results:
+        before = previous.get((row["benchmark"], row["corpus_size"]))
+        if before and row["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{row['benchmark']} @ {row['corpus_size']}: p95 {before['p95_ms']} -> {row['p95_ms']} ms")
+    return regressions
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated corpus sizes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=1, help="API calls in flight at once")
+    parser.add_argument("--repeat", type=int, default=10, help="calls per synthesize-trends benchmark")
+    parser.add_argument("--search-requests", type=int, default=10)
+    parser.add_argument("--search-max-posts", type=int, default=20)
+    parser.add_argument("--analyze-batch", type=int, default=100, help="post IDs per analyze-posts call")
+    parser.add_argument("--min-relevance", type=float, default=20.0)
+    parser.add_argument("--description", default="", help="company description used for scoring")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake server mean latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.02, help="fake server latency standard deviation")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of Reddit requests answered 503")
+    parser.add_argument("--pushshift-error-rate", type=float, default=None, help="defaults to --error-rate")
+    parser.add_argument("--fixtures", type=Path, default=FIXTURES_DIR, help="recorded responses to replay")
+    parser.add_argument("--storage", choices=["mongo", "sqlite"], default="mongo", help="STORAGE_BACKEND to benchmark")
+    parser.add_argument("--sqlite-path", type=Path, help="SQLite file for --storage sqlite (default: a scratch file)")
+    parser.add_argument("--mongo-url", help="benchmark against this MongoDB instead of an in-memory stand-in")
+    parser.add_argument("--db-name", default="reddit_benchmark")
+    parser.add_argument("--json", type=Path, help="write the results here")
+    parser.add_argument("--baseline", type=Path, help="earlier --json output to compare p95 latencies with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 slowdown against the baseline")
+    args = parser.parse_args(argv)
+    args.sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.storage == "mongo" and not args.mongo_url and max(args.sizes) > 1000:
+        print("warning: the in-memory database scans on every update; pass --mongo-url "
+              "for meaningful API numbers on corpora above 1k posts", file=sys.stderr)
+    fake = FakeReddit(
+        fixtures_dir=args.fixtures,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        pushshift_error_rate=args.pushshift_error_rate,
+        seed=args.seed,
+    )
+    with FakeRedditServer(fake) as fake_server:
+        configure_environment(args, fake_server.url)
+        server = import_server()
+        results = asyncio.run(run_benchmarks(server, fake, args))
+
+    print_table(results)
+    print(f"\nfake server requests: {dict(fake.requests)}, errors: {dict(fake.errors)}")
+    if args.json:
+        args.json.write_text(json.dumps({"args": {k: str(v) for k, v in vars(args).items()}, "results": results}, indent=2))
+    if args.baseline:
+        regressions = find_regressions(results, json.loads(args.baseline.read_text())["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
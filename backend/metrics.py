@@ -0,0 +1,123 @@
+"""Prometheus metrics for the API's hot paths, served by GET /metrics.
+
+- http_request_duration_seconds: every API call, by method, route template and status
+- scrape_request_duration_seconds / scrape_requests_total: each upstream GET,
+  by scrape endpoint and subreddit, with its status code (or "error")
+- scrape_subreddit_duration_seconds: a subreddit's whole fallback chain
+  within a search, rate-limiter waits included
+- storage_operation_duration_seconds / storage_operation_errors_total:
+  every storage call, by backend and operation
+- post_analysis_duration_seconds: scoring time per post, by executor
+- cache_hits_total / cache_misses_total / cache_entries: the scrape cache and
+  company profile cache, read when /metrics is scraped
+"""
+import functools
+import inspect
+import time
+from typing import Any, Callable, Dict, Iterable
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Upstream requests and whole searches take seconds, storage calls and
+# per-post analysis milliseconds; buckets cover both ends
+SLOW_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "API request latency until the response starts",
+    ["method", "route", "status"], buckets=SLOW_BUCKETS
+)
+SCRAPE_REQUEST_DURATION = Histogram(
+    "scrape_request_duration_seconds", "Upstream GET latency, including the wait for the host's rate limiter",
+    ["endpoint", "subreddit"], buckets=SLOW_BUCKETS
+)
+SCRAPE_REQUESTS = Counter(
+    "scrape_requests_total", "Upstream GETs by outcome: HTTP status code or 'error'",
+    ["endpoint", "subreddit", "status"]
+)
+SCRAPE_SUBREDDIT_DURATION = Histogram(
+    "scrape_subreddit_duration_seconds", "Time spent on one subreddit of a search, fallbacks included",
+    ["subreddit"], buckets=SLOW_BUCKETS
+)
+STORAGE_OPERATION_DURATION = Histogram(
+    "storage_operation_duration_seconds", "Storage call latency",
+    ["backend", "operation"], buckets=FAST_BUCKETS + (2.5, 5.0, 10.0)
+)
+STORAGE_OPERATION_ERRORS = Counter(
+    "storage_operation_errors_total", "Storage calls that raised",
+    ["backend", "operation"]
+)
+POST_ANALYSIS_DURATION = Histogram(
+    "post_analysis_duration_seconds", "Time to score one post",
+    ["executor"], buckets=FAST_BUCKETS
+)
+
+
+def observe_scrape(endpoint: str, subreddit: str, status: Any, seconds: float):
+    subreddit = subreddit.lower()
+    SCRAPE_REQUEST_DURATION.labels(endpoint, subreddit).observe(seconds)
+    SCRAPE_REQUESTS.labels(endpoint, subreddit, str(status)).inc()
+
+
+class InstrumentedStorage:
+    """Times every coroutine method of a Storage; everything else passes through"""
+
+    def __init__(self, storage, backend: str):
+        self._storage = storage
+        self._backend = backend
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._storage, name)
+        if not inspect.iscoroutinefunction(attribute):
+            return attribute
+
+        duration = STORAGE_OPERATION_DURATION.labels(self._backend, name)
+        errors = STORAGE_OPERATION_ERRORS.labels(self._backend, name)
+
+        @functools.wraps(attribute)
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await attribute(*args, **kwargs)
+            except Exception:
+                errors.inc()
+                raise
+            finally:
+                duration.observe(time.perf_counter() - started)
+
+        return timed
+
+
+class CacheCollector:
+    """Exports hit/miss counters and sizes of in-process caches at scrape time.
+
+    `caches` maps a cache name to a function returning a dict with `hits`,
+    `misses` and `entries`; the caches keep counting on their own, so
+    nothing is added to their hot paths.
+    """
+
+    def __init__(self, caches: Dict[str, Callable[[], Dict[str, Any]]]):
+        self.caches = caches
+
+    def collect(self) -> Iterable:
+        hits = CounterMetricFamily("cache_hits", "Cache lookups answered from the cache", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache lookups that had to compute or fetch", labels=["cache"])
+        entries = GaugeMetricFamily("cache_entries", "Entries currently held", labels=["cache"])
+        for name, stats in self.caches.items():
+            values = stats()
+            hits.add_metric([name], values.get("hits", 0))
+            misses.add_metric([name], values.get("misses", 0))
+            entries.add_metric([name], values.get("entries", 0))
+        yield hits
+        yield misses
+        yield entries
+
+
+def register_caches(caches: Dict[str, Callable[[], Dict[str, Any]]]):
+    REGISTRY.register(CacheCollector(caches))
+
+
+def render() -> tuple:
+    """(body, content type) of the Prometheus text exposition"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,197 @@
+"""Opt-in per-request profiling for the admin endpoints in server.py.
+
+A request carrying the admin token (X-Profile-Token header or profile_token
+query parameter) runs under a profiler; the result is kept in memory under
+the request ID, which is returned in the X-Request-ID response header.
+
+The profiler is cProfile unless PROFILER=pyinstrument and pyinstrument is
+installed. cProfile hooks the whole event-loop thread, so it times CPU
+work, not awaits, and also picks up other requests running concurrently.
+Only one request is profiled at a time, because a thread has a single
+profiler hook; work handed to other threads (the database drivers) only
+shows up as time in the coroutine awaiting it. pyinstrument samples
+wall-clock time and follows awaits. Analyses running in the process pool
+(ANALYSIS_EXECUTOR=process) happen in other processes and are not captured.
+
+A profile covers the whole response: for a streamed body, such as the
+Server-Sent Events of /api/search-reddit/stream, it stays open until the
+last chunk has been sent, not just until the headers go out.
+"""
+import asyncio
+import cProfile
+import io
+import marshal
+import pstats
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+# Where a slow search or analysis batch usually spends its time: label ->
+# (module file suffix, function names, or None for every function in the module)
+FOCUS_AREAS = {
+    "scraper": ("server.py", {
+        "search_reddit", "scrape_subreddit", "scrape_subreddit_search", "scrape_subreddit_hot",
+        "scrape_subreddit_new", "scrape_with_pushshift", "_fetch_subreddit_search", "_fetch_subreddit_hot",
+        "_try_endpoint", "_get",
+    }),
+    "analysis": ("server.py", {"analyze_post_for_eon_health"}),
+    "storage": ("storage.py", None),
+}
+
+
+def focus_area(function: Tuple[str, int, str]) -> Optional[str]:
+    filename, _, name = function
+    for label, (suffix, names) in FOCUS_AREAS.items():
+        if filename.endswith(suffix) and (names is None or name in names):
+            return label
+    return None
+
+
+class ProfileSession:
+    """Profiler for one request; start() and stop() bracket the handler"""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._profiler: Any = None
+
+    def start(self):
+        if self.kind == "pyinstrument":
+            self._profiler = pyinstrument.Profiler(async_mode="enabled")
+            self._profiler.start()
+        else:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self):
+        if self.kind == "pyinstrument":
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def report(self, top: int) -> Tuple[Dict[str, Any], bytes, str]:
+        """(summary, raw data, raw media type) of the finished profile"""
+        if self.kind == "pyinstrument":
+            summary = {"text": self._profiler.output_text(unicode=False, color=False)}
+            return summary, self._profiler.output_html().encode("utf-8"), "text/html"
+
+        stats = pstats.Stats(self._profiler, stream=io.StringIO())
+        functions = []
+        focus: Dict[str, float] = {}
+        for function, (_, ncalls, tottime, cumtime, callers) in stats.stats.items():
+            filename, line, name = function
+            functions.append({
+                "function": f"{filename}:{line}({name})",
+                "calls": ncalls,
+                "self_seconds": round(tottime, 6),
+                "cumulative_seconds": round(cumtime, 6),
+            })
+            label = focus_area(function)
+            if label is None:
+                continue
+            # Count only calls entering the area from outside it, so nested
+            # calls within the area aren't added twice
+            for caller, (_, _, _, caller_cumtime) in callers.items():
+                if focus_area(caller) != label:
+                    focus[label] = focus.get(label, 0.0) + caller_cumtime
+        functions.sort(key=lambda function: function["cumulative_seconds"], reverse=True)
+        summary = {
+            "focus_seconds": {label: round(seconds, 6) for label, seconds in sorted(focus.items())},
+            "functions": functions[:top],
+        }
+        # Same format as pstats.Stats.dump_stats(), readable by snakeviz, flameprof, gprof2dot
+        return summary, marshal.dumps(stats.stats), "application/octet-stream"
+
+
+class ProfileStore:
+    """The last `history` profiles, keyed by request ID"""
+
+    def __init__(self, history: int, kind: str = "cprofile", top: int = 50):
+        self.history = history
+        self.kind = "pyinstrument" if kind == "pyinstrument" and pyinstrument is not None else "cprofile"
+        self.top = top
+        self._profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._raw: Dict[str, Tuple[bytes, str]] = {}
+        self._lock = asyncio.Lock()
+
+    async def profile(self, request_id: str, method: str, path: str, call):
+        """Await `call()` under a profiler and store the result; returns call()'s value.
+
+        When the response has a `body_iterator` (every response from
+        Starlette's call_next does), the profiler keeps running until the
+        body is exhausted, so streamed responses are profiled to the end.
+        """
+        await self._lock.acquire()
+        session = ProfileSession(self.kind)
+        started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+
+        def finish(status: Optional[int]):
+            try:
+                session.stop()
+                elapsed = time.perf_counter() - started
+                summary, raw, media_type = session.report(self.top)
+                self._store(request_id, {
+                    "request_id": request_id,
+                    "method": method,
+                    "path": path,
+                    "status": status,
+                    "profiler": self.kind,
+                    "started_at": started_at,
+                    "wall_seconds": round(elapsed, 6),
+                    **summary,
+                }, raw, media_type)
+            finally:
+                self._lock.release()
+
+        session.start()
+        try:
+            response = await call()
+        except BaseException:
+            finish(None)
+            raise
+        status = getattr(response, "status_code", None)
+        body = getattr(response, "body_iterator", None)
+        if body is None:
+            finish(status)
+            return response
+
+        async def profiled_body():
+            try:
+                async for chunk in body:
+                    yield chunk
+            finally:
+                finish(status)
+
+        response.body_iterator = profiled_body()
+        return response
+
+    def _store(self, request_id: str, profile: Dict[str, Any], raw: bytes, media_type: str):
+        self._profiles[request_id] = profile
+        self._raw[request_id] = (raw, media_type)
+        while len(self._profiles) > self.history:
+            evicted, _ = self._profiles.popitem(last=False)
+            self._raw.pop(evicted, None)
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Newest first, without the per-function detail"""
+        keys = ("request_id", "method", "path", "status", "profiler", "started_at", "wall_seconds", "focus_seconds")
+        return [
+            {key: profile[key] for key in keys if key in profile}
+            for profile in reversed(self._profiles.values())
+        ]
+
+    def get(self, request_id: str) -> Optional[Dict[str, Any]]:
+        return self._profiles.get(request_id)
+
+    def raw(self, request_id: str) -> Optional[Tuple[bytes, str]]:
+        return self._raw.get(request_id)
+
+    def clear(self):
+        self._profiles.clear()
+        self._raw.clear()
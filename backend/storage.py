@@ -0,0 +1,1126 @@
+"""Storage backends for posts, analyses, trend rollups, syntheses and crawl state.
+
+server.py talks to a Storage; which one is chosen by STORAGE_BACKEND:
+
+- MongoStorage: the Motor/MongoDB collections the app has always used
+- SQLiteStorage: an embedded SQLite file in WAL mode, with FTS5 for local
+  search, for single-box deployments and test runs
+
+Both take plain dicts in and hand plain dicts back, so the handlers don't
+depend on either database's query language.
+"""
+import asyncio
+import json
+import re
+import sqlite3
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY_ERROR = 11000
+# How often MongoStorage.save_analyses retries a post that kept being
+# replaced concurrently between its read and its write
+ANALYSIS_SAVE_ATTEMPTS = 5
+
+# (lower, upper, label) relevance histogram buckets
+RelevanceBuckets = List[Tuple[float, float, str]]
+
+
+class Storage(ABC):
+    """Everything the API persists.
+
+    `sort_fields` maps the /api/posts sort keys to stored post fields,
+    `relevance_buckets` shapes the relevance histogram of analysis_stats()
+    and `title_weight` is how much more a title match counts than a body
+    match in search_posts().
+    """
+
+    def __init__(self, sort_fields: Dict[str, str], relevance_buckets: RelevanceBuckets, title_weight: float):
+        self.sort_fields = sort_fields
+        self.relevance_buckets = relevance_buckets
+        self.title_weight = title_weight
+        # Outcome of the last setup(), reported by the diagnostics endpoint
+        self.index_status: List[Dict[str, Any]] = []
+
+    @abstractmethod
+    async def setup(self):
+        """Create any missing table/collection index; existing ones are left untouched"""
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def reset(self):
+        """Delete everything stored (used by the benchmark suite between corpora)"""
+
+    # Posts
+    @abstractmethod
+    async def upsert_posts(self, posts: List[Dict]) -> Dict[str, int]:
+        """Insert new posts whole; for posts already held only refresh upvotes and
+        comments_count, keeping the original scraped_at. Returns inserted/updated counts."""
+
+    @abstractmethod
+    async def get_posts(self, post_ids: List[str]) -> Dict[str, Dict]:
+        """Posts for a batch of IDs, keyed by post ID"""
+
+    @abstractmethod
+    async def set_post_relevance(self, scores: Dict[str, float]):
+        """Copy relevance scores onto posts so list_posts() can filter and sort by them"""
+
+    @abstractmethod
+    async def search_posts(self, query: str, limit: int) -> List[Dict]:
+        """Full-text search over title and content, best match first, each with a text_score"""
+
+    @abstractmethod
+    async def list_posts(self, sort_field: str, limit: int, subreddit: Optional[str] = None,
+                         min_relevance: Optional[float] = None,
+                         after: Optional[Tuple[Any, str]] = None) -> List[Dict]:
+        """Posts in descending (sort_field, id) order, each with its stored 'analysis' or None.
+
+        `after` is the (sort value, post ID) of the last post of the previous
+        page; posts without the field sort last.
+        """
+
+    # Analyses
+    @abstractmethod
+    async def get_analyses(self, post_ids: List[str]) -> Dict[str, Dict]:
+        """Stored analyses for a batch of post IDs, keyed by post ID"""
+
+    @abstractmethod
+    async def save_analyses(self, analyses: List[Dict]) -> List[Optional[Dict]]:
+        """Replace (or insert) the stored analysis of each post, in order.
+
+        Returns, position by position, the analysis each write replaced (None
+        for an insert). A write only lands on the version it reports, so
+        concurrent saves of the same post each see exactly the version they
+        overwrote.
+        """
+
+    @abstractmethod
+    def analyses_with_day(self) -> AsyncIterator[Dict]:
+        """Stream every analysis that carries a post_day"""
+
+    @abstractmethod
+    async def count_analyses(self, subreddit: Optional[str] = None, theme: Optional[str] = None) -> int:
+        pass
+
+    @abstractmethod
+    async def analysis_stats(self, min_relevance: Optional[float] = None, subreddit: Optional[str] = None,
+                             theme: Optional[str] = None) -> Dict[str, Any]:
+        """Trend-synthesis statistics of the matching analyses: total, theme_frequency,
+        relevance_distribution and the 25 most-analyzed subreddit_counts"""
+
+    # Trend rollups: one row per (theme, subreddit, day) holding numeric fields
+    @abstractmethod
+    async def increment_rollups(self, changes: Dict[tuple, Dict[str, float]]):
+        """Add each {field: delta} to its (theme, subreddit, day) row, creating rows as needed"""
+
+    @abstractmethod
+    async def clear_rollups(self):
+        pass
+
+    @abstractmethod
+    async def rollup_totals(self, since_day: str, fields: List[str], subreddit: Optional[str] = None) -> List[Dict]:
+        """`fields` summed per (theme, subreddit) over the rows from since_day on"""
+
+    # Trend syntheses
+    @abstractmethod
+    async def save_synthesis(self, synthesis: Dict):
+        pass
+
+    @abstractmethod
+    async def recent_syntheses(self, limit: int) -> List[Dict]:
+        """Newest first"""
+
+    # Crawl state
+    @abstractmethod
+    async def load_crawl_states(self, subreddits: List[str]) -> List[Dict]:
+        pass
+
+    @abstractmethod
+    async def save_crawl_state(self, state: Dict):
+        pass
+
+    # Diagnostics
+    @abstractmethod
+    async def query_plans(self) -> List[Dict[str, Any]]:
+        """Explain a representative form of every query: stages, indexes used and
+        whether it falls back to scanning a whole collection/table"""
+
+
+def collect_plan_stages(plan: Any) -> List[str]:
+    """Every 'stage' name found anywhere in an explain() document"""
+    stages = []
+    if isinstance(plan, dict):
+        if isinstance(plan.get('stage'), str):
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(collect_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(collect_plan_stages(item))
+    return stages
+
+
+def collect_plan_indexes(plan: Any) -> List[str]:
+    """Every index name an explain() document's winning plan scans"""
+    names = []
+    if isinstance(plan, dict):
+        if isinstance(plan.get('indexName'), str):
+            names.append(plan['indexName'])
+        for value in plan.values():
+            names.extend(collect_plan_indexes(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            names.extend(collect_plan_indexes(item))
+    return names
+
+
+class MongoStorage(Storage):
+    """Collections reddit_posts, post_analyses, trend_rollups, trend_syntheses and crawl_state"""
+
+    def __init__(self, db, sort_fields: Dict[str, str], relevance_buckets: RelevanceBuckets, title_weight: float):
+        super().__init__(sort_fields, relevance_buckets, title_weight)
+        self.db = db
+
+    def index_specs(self) -> List[tuple]:
+        """Indexes every query relies on: (collection, keys, options)"""
+        return [
+            # Upserts and $in lookups by post ID; unique so racing searches can't duplicate a post
+            ("reddit_posts", [("id", 1)], {"unique": True}),
+            # Full-text search of stored posts; MongoDB allows one text index per collection
+            ("reddit_posts", [("title", "text"), ("content", "text")],
+             {"name": "post_text", "weights": {"title": self.title_weight, "content": 1}}),
+            # One analysis per post, joined by /api/posts and loaded by /api/analyze-posts
+            ("post_analyses", [("post_id", 1)], {"unique": True}),
+            # Relevance threshold in /api/synthesize-trends, optionally within a subreddit or theme
+            ("post_analyses", [("relevance_score", -1)], {}),
+            ("post_analyses", [("subreddit", 1), ("relevance_score", -1)], {}),
+            ("post_analyses", [("detected_themes", 1), ("relevance_score", -1)], {}),
+            # One rollup row per theme x subreddit x day, read by time window
+            ("trend_rollups", [("theme", 1), ("subreddit", 1), ("day", 1)], {"unique": True}),
+            ("trend_rollups", [("day", 1)], {}),
+            ("trend_rollups", [("subreddit", 1), ("day", 1)], {}),
+            # Per-subreddit high-water marks of the scheduled crawler
+            ("crawl_state", [("subreddit", 1)], {"unique": True}),
+            # Newest-first listing in /api/trends
+            ("trend_syntheses", [("created_at", -1)], {}),
+        ] + [
+            # Every /api/posts sort order, globally and within a subreddit
+            spec
+            for field_name in self.sort_fields.values()
+            for spec in (
+                ("reddit_posts", [(field_name, -1), ("id", -1)], {}),
+                ("reddit_posts", [("subreddit", 1), (field_name, -1), ("id", -1)], {}),
+            )
+        ]
+
+    async def setup(self):
+        self.index_status.clear()
+        for collection, keys, options in self.index_specs():
+            status = {"collection": collection, "keys": keys, **options}
+            try:
+                status["name"] = await self.db[collection].create_index(keys, **options)
+                status["ok"] = True
+            except Exception as e:
+                print(f"Could not create index {keys} on {collection}: {e}")
+                status["ok"] = False
+                status["error"] = str(e)
+            self.index_status.append(status)
+
+    async def reset(self):
+        for collection in ("reddit_posts", "post_analyses", "trend_rollups", "trend_syntheses", "crawl_state"):
+            await self.db[collection].drop()
+        await self.setup()
+
+    async def upsert_posts(self, posts: List[Dict]) -> Dict[str, int]:
+        if not posts:
+            return {"inserted": 0, "updated": 0}
+
+        operations = []
+        for post in posts:
+            post = dict(post)
+            # Convert datetime to ISO string for MongoDB storage
+            if isinstance(post.get('scraped_at'), datetime):
+                post['scraped_at'] = post['scraped_at'].isoformat()
+            engagement = {
+                'upvotes': post.pop('upvotes'),
+                'comments_count': post.pop('comments_count')
+            }
+            operations.append(UpdateOne(
+                {"id": post['id']},
+                {"$set": engagement, "$setOnInsert": post},
+                upsert=True
+            ))
+
+        try:
+            result = await self.db.reddit_posts.bulk_write(operations, ordered=False)
+            return {"inserted": result.upserted_count, "updated": result.modified_count}
+        except BulkWriteError as e:
+            # A concurrent search may have inserted the same post first; the unique
+            # index rejects our copy, which is exactly what we want
+            if any(error.get('code') != DUPLICATE_KEY_ERROR for error in e.details.get('writeErrors', [])):
+                raise
+            return {"inserted": e.details.get('nUpserted', 0), "updated": e.details.get('nModified', 0)}
+
+    async def get_posts(self, post_ids: List[str]) -> Dict[str, Dict]:
+        posts = await self.db.reddit_posts.find({"id": {"$in": post_ids}}, {"_id": 0}).to_list(length=None)
+        return {post['id']: post for post in posts}
+
+    async def set_post_relevance(self, scores: Dict[str, float]):
+        if not scores:
+            return
+        await self.db.reddit_posts.bulk_write(
+            [UpdateOne({"id": post_id}, {"$set": {"relevance_score": score}}) for post_id, score in scores.items()],
+            ordered=False
+        )
+
+    async def search_posts(self, query: str, limit: int) -> List[Dict]:
+        # textScore sums the field-weighted frequency of each stemmed query term,
+        # damped by document length; ties go to the more upvoted post
+        cursor = self.db.reddit_posts.find(
+            {"$text": {"$search": query}},
+            {"_id": 0, "text_score": {"$meta": "textScore"}}
+        ).sort([("text_score", {"$meta": "textScore"}), ("upvotes", -1)]).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    @staticmethod
+    def posts_after(field_name: str, value: Any, post_id: str) -> Dict:
+        """Filter for the posts that follow (value, post_id) in descending order"""
+        if value is None:
+            # Posts without the field sort last; only the ID tie-breaker is left
+            return {field_name: None, "id": {"$lt": post_id}}
+        return {"$or": [
+            {field_name: {"$lt": value}},
+            {field_name: value, "id": {"$lt": post_id}},
+            {field_name: None},
+        ]}
+
+    async def list_posts(self, sort_field: str, limit: int, subreddit: Optional[str] = None,
+                         min_relevance: Optional[float] = None,
+                         after: Optional[Tuple[Any, str]] = None) -> List[Dict]:
+        conditions = []
+        if subreddit:
+            conditions.append({"subreddit": subreddit})
+        if min_relevance:
+            conditions.append({"relevance_score": {"$gte": min_relevance}})
+        if after:
+            conditions.append(self.posts_after(sort_field, *after))
+
+        # Filter, sort and limit on reddit_posts first, so the join only runs for one page
+        pipeline = [
+            {"$match": {"$and": conditions} if conditions else {}},
+            {"$sort": {sort_field: -1, "id": -1}},
+            {"$limit": limit},
+            {"$lookup": {"from": "post_analyses", "localField": "id", "foreignField": "post_id", "as": "analysis"}},
+            {"$addFields": {"analysis": {"$arrayElemAt": ["$analysis", 0]}}},
+            {"$project": {"_id": 0, "analysis._id": 0, "analysis.revision": 0}},
+        ]
+        posts = await self.db.reddit_posts.aggregate(pipeline).to_list(length=None)
+        for post in posts:
+            post['analysis'] = post.get('analysis') or None
+        return posts
+
+    async def get_analyses(self, post_ids: List[str]) -> Dict[str, Dict]:
+        analyses = await self.db.post_analyses.find(
+            {"post_id": {"$in": post_ids}}, {"_id": 0, "revision": 0}
+        ).to_list(length=None)
+        return {analysis['post_id']: analysis for analysis in analyses}
+
+    async def _versioned_analyses(self, post_ids: List[str]) -> Dict[str, Dict]:
+        analyses = await self.db.post_analyses.find({"post_id": {"$in": post_ids}}, {"_id": 0}).to_list(length=None)
+        return {analysis['post_id']: analysis for analysis in analyses}
+
+    async def _replace_analyses(self, operations: List[ReplaceOne]) -> List[int]:
+        """One unordered bulk write; returns the positions that lost a race.
+
+        A conditional upsert whose revision no longer matches tries to insert
+        a second document for the post, which the unique post_id index rejects.
+        """
+        try:
+            await self.db.post_analyses.bulk_write(operations, ordered=False)
+            return []
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            if any(error.get('code') != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            return sorted(error['index'] for error in errors)
+
+    async def save_analyses(self, analyses: List[Dict]) -> List[Optional[Dict]]:
+        previous: List[Optional[Dict]] = [None] * len(analyses)
+        attempts = [0] * len(analyses)
+        pending = list(range(len(analyses)))
+        while pending:
+            # One write per post and round; repeats of a post wait for a later round
+            batch, later, post_ids = [], [], set()
+            for index in pending:
+                post_id = analyses[index]['post_id']
+                (later if post_id in post_ids else batch).append(index)
+                post_ids.add(post_id)
+            
+            stored = await self._versioned_analyses(list(post_ids))
+            operations = []
+            for index in batch:
+                post_id = analyses[index]['post_id']
+                current = stored.get(post_id)
+                # Write only over the revision just read; a missing field
+                # matches None, so that also covers a post not analyzed yet
+                revision = current.pop('revision', None) if current else None
+                previous[index] = current
+                attempts[index] += 1
+                operations.append(ReplaceOne(
+                    {"post_id": post_id, "revision": revision},
+                    {**analyses[index], "revision": (revision or 0) + 1},
+                    upsert=True
+                ))
+            
+            conflicts = [batch[position] for position in await self._replace_analyses(operations)]
+            for index in conflicts:
+                if attempts[index] >= ANALYSIS_SAVE_ATTEMPTS:
+                    raise RuntimeError(
+                        f"Analysis of post {analyses[index]['post_id']} kept changing; gave up after {attempts[index]} attempts"
+                    )
+            pending = sorted(conflicts + later)
+        return previous
+
+    async def analyses_with_day(self) -> AsyncIterator[Dict]:
+        projection = {"_id": 0, "post_day": 1, "subreddit": 1, "detected_themes": 1,
+                      "relevance_score": 1, "upvotes": 1, "comments_count": 1}
+        async for analysis in self.db.post_analyses.find({"post_day": {"$gt": ""}}, projection):
+            yield analysis
+
+    @staticmethod
+    def analysis_match(min_relevance: Optional[float] = None, subreddit: Optional[str] = None,
+                       theme: Optional[str] = None) -> Dict:
+        match: Dict[str, Any] = {}
+        if subreddit:
+            match["subreddit"] = subreddit
+        if theme:
+            match["detected_themes"] = theme
+        if min_relevance is not None:
+            match["relevance_score"] = {"$gte": min_relevance}
+        return match
+
+    async def count_analyses(self, subreddit: Optional[str] = None, theme: Optional[str] = None) -> int:
+        return await self.db.post_analyses.count_documents(self.analysis_match(subreddit=subreddit, theme=theme))
+
+    def analysis_stats_pipeline(self, match: Dict) -> List[Dict]:
+        """Aggregation computing trend-synthesis statistics for the matching analyses.
+
+        Only the small grouped results leave the server: the total, theme
+        frequencies, relevance histogram and the most-analyzed subreddits.
+        """
+        return [
+            {"$match": match},
+            {"$facet": {
+                "total": [{"$count": "count"}],
+                "themes": [
+                    {"$unwind": "$detected_themes"},
+                    {"$group": {"_id": "$detected_themes", "count": {"$sum": 1}}},
+                ],
+                "relevance": [
+                    {"$bucket": {
+                        "groupBy": "$relevance_score",
+                        "boundaries": [lower for lower, _, _ in self.relevance_buckets] + [self.relevance_buckets[-1][1]],
+                        "default": "other",
+                        "output": {"count": {"$sum": 1}},
+                    }},
+                ],
+                "subreddits": [
+                    {"$group": {"_id": "$subreddit", "count": {"$sum": 1}}},
+                    {"$sort": {"count": -1}},
+                    {"$limit": 25},
+                ],
+            }},
+        ]
+
+    async def analysis_stats(self, min_relevance: Optional[float] = None, subreddit: Optional[str] = None,
+                             theme: Optional[str] = None) -> Dict[str, Any]:
+        match = self.analysis_match(min_relevance, subreddit, theme)
+        result = await self.db.post_analyses.aggregate(self.analysis_stats_pipeline(match)).to_list(length=1)
+        facets = result[0] if result else {}
+        bucket_labels = {lower: label for lower, _, label in self.relevance_buckets}
+        total = facets.get("total", [])
+        return {
+            "total": total[0]["count"] if total else 0,
+            "theme_frequency": {group["_id"]: group["count"] for group in facets.get("themes", []) if group["_id"]},
+            "relevance_distribution": {
+                bucket_labels.get(group["_id"], str(group["_id"])): group["count"] for group in facets.get("relevance", [])
+            },
+            "subreddit_counts": {group["_id"]: group["count"] for group in facets.get("subreddits", []) if group["_id"]},
+        }
+
+    async def increment_rollups(self, changes: Dict[tuple, Dict[str, float]]):
+        # One unordered bulk write of $inc upserts
+        operations = [
+            UpdateOne({"theme": theme, "subreddit": subreddit, "day": day}, {"$inc": increments}, upsert=True)
+            for (theme, subreddit, day), increments in changes.items()
+            if any(increments.values())
+        ]
+        if operations:
+            await self.db.trend_rollups.bulk_write(operations, ordered=False)
+
+    async def clear_rollups(self):
+        await self.db.trend_rollups.delete_many({})
+
+    async def rollup_totals(self, since_day: str, fields: List[str], subreddit: Optional[str] = None) -> List[Dict]:
+        match: Dict[str, Any] = {"day": {"$gte": since_day}}
+        if subreddit:
+            match["subreddit"] = subreddit
+        # Group output names can't contain dots, so sum into f0, f1, ... and rename
+        group: Dict[str, Any] = {"_id": {"theme": "$theme", "subreddit": "$subreddit"}}
+        for position, field_name in enumerate(fields):
+            group[f"f{position}"] = {"$sum": f"${field_name}"}
+        rows = await self.db.trend_rollups.aggregate([{"$match": match}, {"$group": group}]).to_list(length=None)
+        return [
+            {
+                "theme": row["_id"]["theme"],
+                "subreddit": row["_id"]["subreddit"],
+                **{field_name: row.get(f"f{position}", 0) for position, field_name in enumerate(fields)},
+            }
+            for row in rows
+        ]
+
+    async def save_synthesis(self, synthesis: Dict):
+        await self.db.trend_syntheses.insert_one(dict(synthesis))
+
+    async def recent_syntheses(self, limit: int) -> List[Dict]:
+        return await self.db.trend_syntheses.find({}, {"_id": 0}).sort("created_at", -1).limit(limit).to_list(length=None)
+
+    async def load_crawl_states(self, subreddits: List[str]) -> List[Dict]:
+        return await self.db.crawl_state.find({"subreddit": {"$in": subreddits}}, {"_id": 0}).to_list(length=None)
+
+    async def save_crawl_state(self, state: Dict):
+        await self.db.crawl_state.replace_one({"subreddit": state['subreddit']}, dict(state), upsert=True)
+
+    def diagnostic_queries(self) -> List[Dict]:
+        """Representative form of every query the API issues"""
+        threshold = {"relevance_score": {"$gte": 50.0}}
+        return [
+            {"name": "store_posts upsert", "command": {"find": "reddit_posts", "filter": {"id": "diagnostic"}}},
+            {"name": "search-reddit local search", "command": {"find": "reddit_posts", "filter": {"$text": {"$search": "diagnostic"}}, "limit": 20}},
+            {"name": "analyze-posts load posts", "command": {"find": "reddit_posts", "filter": {"id": {"$in": ["diagnostic"]}}}},
+            {"name": "analyze-posts load analyses", "command": {"find": "post_analyses", "filter": {"post_id": {"$in": ["diagnostic"]}}}},
+            {"name": "synthesize-trends relevance threshold", "command": {"find": "post_analyses", "filter": threshold}},
+            {"name": "synthesize-trends statistics", "command": {"aggregate": "post_analyses", "pipeline": self.analysis_stats_pipeline(threshold), "cursor": {}}},
+            {"name": "synthesize-trends statistics for a subreddit", "command": {"aggregate": "post_analyses", "pipeline": self.analysis_stats_pipeline({"subreddit": "diagnostic", **threshold}), "cursor": {}}},
+            {"name": "synthesize-trends statistics for a theme", "command": {"aggregate": "post_analyses", "pipeline": self.analysis_stats_pipeline({"detected_themes": "diagnostic", **threshold}), "cursor": {}}},
+            {"name": "synthesize-trends rollup window", "command": {"find": "trend_rollups", "filter": {"day": {"$gte": "2024-01-01"}}}},
+            {"name": "synthesize-trends rollup window for a subreddit", "command": {"find": "trend_rollups", "filter": {"subreddit": "diagnostic", "day": {"$gte": "2024-01-01"}}}},
+            {"name": "trends newest first", "command": {"find": "trend_syntheses", "filter": {}, "sort": {"created_at": -1}, "limit": 10}},
+        ] + [
+            {
+                "name": f"posts sorted by {sort_by}{' in subreddit' if subreddit else ''}",
+                "command": {
+                    "find": "reddit_posts",
+                    "filter": {"subreddit": "diagnostic"} if subreddit else {},
+                    "sort": {field_name: -1, "id": -1},
+                    "limit": 51,
+                },
+            }
+            for sort_by, field_name in self.sort_fields.items()
+            for subreddit in (False, True)
+        ]
+
+    async def query_plans(self) -> List[Dict[str, Any]]:
+        queries = []
+        for query in self.diagnostic_queries():
+            report = {"name": query["name"], "collection": query["command"].get("find") or query["command"].get("aggregate")}
+            try:
+                explain = await self.db.command({"explain": query["command"], "verbosity": "queryPlanner"})
+                winning_plan = explain.get('queryPlanner', explain).get('winningPlan', explain)
+                stages = collect_plan_stages(winning_plan)
+                report.update({
+                    "stages": stages,
+                    "indexes_used": sorted(set(collect_plan_indexes(winning_plan))),
+                    "collscan": "COLLSCAN" in stages,
+                })
+            except Exception as e:
+                report["error"] = str(e)
+            queries.append(report)
+        return queries
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _decode_object(obj: Dict) -> Any:
+    if len(obj) == 1 and "$date" in obj:
+        return datetime.fromisoformat(obj["$date"])
+    return obj
+
+
+def encode_document(document: Dict) -> str:
+    """JSON for a document column; datetimes round-trip as {"$date": iso}"""
+    return json.dumps(document, default=_encode_value)
+
+
+def decode_document(text: str) -> Dict:
+    return json.loads(text, object_hook=_decode_object)
+
+
+POST_COLUMNS = ("id", "title", "content", "subreddit", "author", "upvotes", "comments_count",
+                "url", "created_at", "scraped_at", "relevance_score")
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reddit_posts (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL DEFAULT '',
+    content TEXT NOT NULL DEFAULT '',
+    subreddit TEXT NOT NULL DEFAULT '',
+    author TEXT,
+    upvotes INTEGER NOT NULL DEFAULT 0,
+    comments_count INTEGER NOT NULL DEFAULT 0,
+    url TEXT,
+    created_at TEXT,
+    scraped_at TEXT,
+    relevance_score REAL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS reddit_posts_fts USING fts5(
+    title, content, content='reddit_posts', content_rowid='rowid', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS reddit_posts_fts_insert AFTER INSERT ON reddit_posts BEGIN
+    INSERT INTO reddit_posts_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS reddit_posts_fts_delete AFTER DELETE ON reddit_posts BEGIN
+    INSERT INTO reddit_posts_fts(reddit_posts_fts, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS reddit_posts_fts_update AFTER UPDATE OF title, content ON reddit_posts BEGIN
+    INSERT INTO reddit_posts_fts(reddit_posts_fts, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+    INSERT INTO reddit_posts_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+END;
+CREATE TABLE IF NOT EXISTS post_analyses (
+    post_id TEXT PRIMARY KEY,
+    subreddit TEXT NOT NULL DEFAULT '',
+    relevance_score REAL NOT NULL,
+    post_day TEXT NOT NULL DEFAULT '',
+    document TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS analysis_themes (
+    theme TEXT NOT NULL,
+    post_id TEXT NOT NULL,
+    relevance_score REAL NOT NULL,
+    PRIMARY KEY (theme, post_id)
+);
+CREATE TABLE IF NOT EXISTS trend_rollups (
+    theme TEXT NOT NULL,
+    subreddit TEXT NOT NULL,
+    day TEXT NOT NULL,
+    field TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (theme, subreddit, day, field)
+);
+CREATE TABLE IF NOT EXISTS trend_syntheses (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    document TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS crawl_state (
+    subreddit TEXT PRIMARY KEY,
+    document TEXT NOT NULL
+);
+"""
+
+SQLITE_TABLES = ("reddit_posts", "post_analyses", "analysis_themes", "trend_rollups", "trend_syntheses", "crawl_state")
+
+# Rows per executemany / IN (...) list, under SQLite's bound-parameter limit
+SQLITE_BATCH_SIZE = 500
+
+
+class SQLiteStorage(Storage):
+    """Embedded storage in one SQLite file.
+
+    Every statement runs on a single dedicated thread that owns the
+    connection, so the event loop never blocks on disk and writes are
+    serialized the way SQLite wants them. WAL mode lets readers in other
+    processes (e.g. the sqlite3 shell) proceed during writes. Analyses keep
+    their full document as JSON next to the columns that are filtered on,
+    and their themes in analysis_themes; rollups store one row per numeric
+    field so increments are a plain upsert.
+    """
+
+    def __init__(self, path: str, sort_fields: Dict[str, str], relevance_buckets: RelevanceBuckets, title_weight: float):
+        super().__init__(sort_fields, relevance_buckets, title_weight)
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-storage")
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA temp_store=MEMORY")
+            self._connection = connection
+        return self._connection
+
+    async def _run(self, function, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    def index_specs(self) -> List[Tuple[str, str, str]]:
+        """(index name, table, column list) for every query's access path"""
+        specs = [
+            # Relevance threshold in /api/synthesize-trends, optionally within a subreddit or theme
+            ("ix_analyses_relevance", "post_analyses", "relevance_score DESC"),
+            ("ix_analyses_subreddit_relevance", "post_analyses", "subreddit, relevance_score DESC"),
+            ("ix_analysis_themes_relevance", "analysis_themes", "theme, relevance_score DESC"),
+            ("ix_analysis_themes_post", "analysis_themes", "post_id"),
+            # Rollups read by time window
+            ("ix_rollups_day", "trend_rollups", "day"),
+            ("ix_rollups_subreddit_day", "trend_rollups", "subreddit, day"),
+            # Newest-first listing in /api/trends
+            ("ix_syntheses_created", "trend_syntheses", "created_at DESC"),
+        ]
+        # Every /api/posts sort order, globally and within a subreddit
+        for column in self.sort_fields.values():
+            specs.append((f"ix_posts_{column}", "reddit_posts", f"{column} DESC, id DESC"))
+            specs.append((f"ix_posts_subreddit_{column}", "reddit_posts", f"subreddit, {column} DESC, id DESC"))
+        return specs
+
+    def _setup(self):
+        connection = self._connect()
+        connection.executescript(SQLITE_SCHEMA)
+        self.index_status.clear()
+        for name, table, columns in self.index_specs():
+            status = {"collection": table, "keys": columns, "name": name}
+            try:
+                connection.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+                status["ok"] = True
+            except sqlite3.Error as e:
+                print(f"Could not create index {name} on {table}: {e}")
+                status["ok"] = False
+                status["error"] = str(e)
+            self.index_status.append(status)
+        connection.commit()
+
+    async def setup(self):
+        await self._run(self._setup)
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def close(self):
+        await self._run(self._close)
+
+    def _reset(self):
+        connection = self._connect()
+        with connection:
+            for table in SQLITE_TABLES:
+                connection.execute(f"DELETE FROM {table}")
+
+    async def reset(self):
+        await self._run(self._reset)
+
+    @staticmethod
+    def _batches(items: List, size: int = SQLITE_BATCH_SIZE):
+        for start in range(0, len(items), size):
+            yield items[start:start + size]
+
+    @staticmethod
+    def _placeholders(count: int) -> str:
+        return ", ".join("?" * count)
+
+    # Posts
+    def _upsert_posts(self, posts: List[Dict]) -> Dict[str, int]:
+        connection = self._connect()
+        inserted = updated = 0
+        with connection:
+            for batch in self._batches(posts):
+                ids = [post['id'] for post in batch]
+                # (upvotes, comments_count) of the posts already held; total_changes
+                # can't tell inserts from updates because the FTS triggers count too
+                existing = {row[0]: (row[1], row[2]) for row in connection.execute(
+                    f"SELECT id, upvotes, comments_count FROM reddit_posts WHERE id IN ({self._placeholders(len(ids))})", ids)}
+                rows = []
+                for post in batch:
+                    engagement = (post.get('upvotes', 0), post.get('comments_count', 0))
+                    if post['id'] not in existing:
+                        inserted += 1
+                        existing[post['id']] = engagement
+                    elif existing[post['id']] != engagement:
+                        updated += 1
+                        existing[post['id']] = engagement
+                    scraped_at = post.get('scraped_at')
+                    if isinstance(scraped_at, datetime):
+                        scraped_at = scraped_at.isoformat()
+                    rows.append((post['id'], post.get('title', ''), post.get('content', ''), post.get('subreddit', ''),
+                                 post.get('author'), post.get('upvotes', 0), post.get('comments_count', 0),
+                                 post.get('url'), post.get('created_at'), scraped_at))
+                connection.executemany(
+                    "INSERT INTO reddit_posts (id, title, content, subreddit, author, upvotes, comments_count, url, created_at, scraped_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET upvotes = excluded.upvotes, comments_count = excluded.comments_count "
+                    "WHERE upvotes != excluded.upvotes OR comments_count != excluded.comments_count",
+                    rows
+                )
+        return {"inserted": inserted, "updated": updated}
+
+    async def upsert_posts(self, posts: List[Dict]) -> Dict[str, int]:
+        if not posts:
+            return {"inserted": 0, "updated": 0}
+        return await self._run(self._upsert_posts, posts)
+
+    @staticmethod
+    def _post_from_row(row: sqlite3.Row) -> Dict:
+        post = {column: row[column] for column in POST_COLUMNS}
+        if post['relevance_score'] is None:
+            del post['relevance_score']
+        return post
+
+    def _get_posts(self, post_ids: List[str]) -> Dict[str, Dict]:
+        connection = self._connect()
+        posts = {}
+        for batch in self._batches(post_ids):
+            for row in connection.execute(
+                    f"SELECT * FROM reddit_posts WHERE id IN ({self._placeholders(len(batch))})", batch):
+                posts[row['id']] = self._post_from_row(row)
+        return posts
+
+    async def get_posts(self, post_ids: List[str]) -> Dict[str, Dict]:
+        return await self._run(self._get_posts, list(post_ids))
+
+    def _set_post_relevance(self, scores: Dict[str, float]):
+        connection = self._connect()
+        with connection:
+            connection.executemany("UPDATE reddit_posts SET relevance_score = ? WHERE id = ?",
+                                   [(score, post_id) for post_id, score in scores.items()])
+
+    async def set_post_relevance(self, scores: Dict[str, float]):
+        if scores:
+            await self._run(self._set_post_relevance, scores)
+
+    @staticmethod
+    def fts_query(query: str) -> str:
+        """Any of the query's words, each quoted so FTS5 syntax in user input is inert"""
+        return " OR ".join('"{}"'.format(word.replace('"', '""')) for word in re.findall(r"\w+", query))
+
+    def search_sql(self) -> str:
+        # bm25() is lower-is-better; text_score flips it so higher means a better match
+        weights = f"{float(self.title_weight)}, 1.0"
+        return (
+            f"SELECT p.*, -bm25(reddit_posts_fts, {weights}) AS text_score "
+            "FROM reddit_posts_fts JOIN reddit_posts p ON p.rowid = reddit_posts_fts.rowid "
+            f"WHERE reddit_posts_fts MATCH ? ORDER BY bm25(reddit_posts_fts, {weights}), p.upvotes DESC LIMIT ?"
+        )
+
+    def _search_posts(self, query: str, limit: int) -> List[Dict]:
+        hits = []
+        for row in self._connect().execute(self.search_sql(), (self.fts_query(query), limit)):
+            post = self._post_from_row(row)
+            post['text_score'] = row['text_score']
+            hits.append(post)
+        return hits
+
+    async def search_posts(self, query: str, limit: int) -> List[Dict]:
+        if not self.fts_query(query):
+            return []
+        return await self._run(self._search_posts, query, limit)
+
+    def posts_page_sql(self, sort_field: str, limit: int, subreddit: Optional[str] = None,
+                       min_relevance: Optional[float] = None,
+                       after: Optional[Tuple[Any, str]] = None) -> Tuple[str, List]:
+        if sort_field not in POST_COLUMNS:
+            raise ValueError(f"Unknown sort field {sort_field}")
+        conditions, params = [], []
+        if subreddit:
+            conditions.append("subreddit = ?")
+            params.append(subreddit)
+        if min_relevance:
+            conditions.append("relevance_score >= ?")
+            params.append(min_relevance)
+        if after:
+            value, post_id = after
+            if value is None:
+                # Posts without the field sort last; only the ID tie-breaker is left
+                conditions.append(f"({sort_field} IS NULL AND id < ?)")
+                params.append(post_id)
+            else:
+                conditions.append(f"({sort_field} < ? OR ({sort_field} = ? AND id < ?) OR {sort_field} IS NULL)")
+                params.extend([value, value, post_id])
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        sql = f"SELECT * FROM reddit_posts {where}ORDER BY {sort_field} DESC, id DESC LIMIT ?"
+        return sql, params + [limit]
+
+    def _list_posts(self, sql: str, params: List) -> List[Dict]:
+        connection = self._connect()
+        posts = [self._post_from_row(row) for row in connection.execute(sql, params)]
+        analyses = self._get_analyses([post['id'] for post in posts])
+        for post in posts:
+            post['analysis'] = analyses.get(post['id'])
+        return posts
+
+    async def list_posts(self, sort_field: str, limit: int, subreddit: Optional[str] = None,
+                         min_relevance: Optional[float] = None,
+                         after: Optional[Tuple[Any, str]] = None) -> List[Dict]:
+        sql, params = self.posts_page_sql(sort_field, limit, subreddit, min_relevance, after)
+        return await self._run(self._list_posts, sql, params)
+
+    # Analyses
+    def _get_analyses(self, post_ids: List[str]) -> Dict[str, Dict]:
+        connection = self._connect()
+        analyses = {}
+        for batch in self._batches(post_ids):
+            for row in connection.execute(
+                    f"SELECT post_id, document FROM post_analyses WHERE post_id IN ({self._placeholders(len(batch))})", batch):
+                analyses[row['post_id']] = decode_document(row['document'])
+        return analyses
+
+    async def get_analyses(self, post_ids: List[str]) -> Dict[str, Dict]:
+        return await self._run(self._get_analyses, list(post_ids))
+
+    def _save_analyses(self, analyses: List[Dict]) -> List[Optional[Dict]]:
+        connection = self._connect()
+        previous: List[Optional[Dict]] = []
+        with connection:
+            for batch in self._batches(analyses):
+                ids = [analysis['post_id'] for analysis in batch]
+                # Read and replace in one transaction on the single storage thread
+                current = {
+                    row['post_id']: decode_document(row['document'])
+                    for row in connection.execute(
+                        f"SELECT post_id, document FROM post_analyses WHERE post_id IN ({self._placeholders(len(ids))})", ids)
+                }
+                for analysis in batch:
+                    previous.append(current.get(analysis['post_id']))
+                    current[analysis['post_id']] = analysis
+                connection.execute(f"DELETE FROM analysis_themes WHERE post_id IN ({self._placeholders(len(ids))})", ids)
+                connection.executemany(
+                    "INSERT OR REPLACE INTO post_analyses (post_id, subreddit, relevance_score, post_day, document) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(analysis['post_id'], analysis.get('subreddit', ''), analysis['relevance_score'],
+                      analysis.get('post_day', ''), encode_document(analysis)) for analysis in batch]
+                )
+                connection.executemany(
+                    "INSERT OR IGNORE INTO analysis_themes (theme, post_id, relevance_score) VALUES (?, ?, ?)",
+                    [(theme, analysis['post_id'], analysis['relevance_score'])
+                     for analysis in batch for theme in analysis.get('detected_themes', [])]
+                )
+        return previous
+
+    async def save_analyses(self, analyses: List[Dict]) -> List[Optional[Dict]]:
+        if not analyses:
+            return []
+        return await self._run(self._save_analyses, analyses)
+
+    def _analyses_page(self, after_post_id: str, limit: int) -> List[Dict]:
+        rows = self._connect().execute(
+            "SELECT post_id, document FROM post_analyses WHERE post_day > '' AND post_id > ? ORDER BY post_id LIMIT ?",
+            (after_post_id, limit)
+        ).fetchall()
+        return [decode_document(row['document']) for row in rows]
+
+    async def analyses_with_day(self) -> AsyncIterator[Dict]:
+        after_post_id = ""
+        while True:
+            page = await self._run(self._analyses_page, after_post_id, SQLITE_BATCH_SIZE)
+            for analysis in page:
+                yield analysis
+            if len(page) < SQLITE_BATCH_SIZE:
+                return
+            after_post_id = page[-1]['post_id']
+
+    @staticmethod
+    def analysis_filter(min_relevance: Optional[float] = None, subreddit: Optional[str] = None,
+                        theme: Optional[str] = None) -> Tuple[str, List]:
+        """WHERE clause over post_analyses aliased `a`"""
+        conditions, params = [], []
+        if subreddit:
+            conditions.append("a.subreddit = ?")
+            params.append(subreddit)
+        if min_relevance is not None:
+            conditions.append("a.relevance_score >= ?")
+            params.append(min_relevance)
+        if theme:
+            # Driven by the (theme, relevance_score) index rather than a scan of every analysis
+            theme_condition = "t.theme = ?" + (" AND t.relevance_score >= ?" if min_relevance is not None else "")
+            conditions.append(f"a.post_id IN (SELECT t.post_id FROM analysis_themes t WHERE {theme_condition})")
+            params.extend([theme] + ([min_relevance] if min_relevance is not None else []))
+        return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+    def _count_analyses(self, subreddit: Optional[str], theme: Optional[str]) -> int:
+        where, params = self.analysis_filter(subreddit=subreddit, theme=theme)
+        return self._connect().execute(f"SELECT COUNT(*) FROM post_analyses a {where}", params).fetchone()[0]
+
+    async def count_analyses(self, subreddit: Optional[str] = None, theme: Optional[str] = None) -> int:
+        return await self._run(self._count_analyses, subreddit, theme)
+
+    def analysis_stats_sql(self, where: str) -> Dict[str, str]:
+        """One statement per statistic, all over the analyses matching `where`"""
+        bucket_cases = " ".join(
+            f"WHEN a.relevance_score >= {float(lower)} AND a.relevance_score < {float(upper)} THEN '{label}'"
+            for lower, upper, label in self.relevance_buckets
+        )
+        return {
+            "total": f"SELECT COUNT(*) FROM post_analyses a {where}",
+            "themes": f"SELECT t.theme, COUNT(*) FROM analysis_themes t JOIN post_analyses a ON a.post_id = t.post_id {where} GROUP BY t.theme",
+            "relevance": f"SELECT CASE {bucket_cases} ELSE 'other' END AS bucket, COUNT(*) FROM post_analyses a {where} GROUP BY bucket",
+            "subreddits": f"SELECT a.subreddit, COUNT(*) AS count FROM post_analyses a {where} GROUP BY a.subreddit ORDER BY count DESC LIMIT 25",
+        }
+
+    def _analysis_stats(self, min_relevance: Optional[float], subreddit: Optional[str], theme: Optional[str]) -> Dict[str, Any]:
+        connection = self._connect()
+        where, params = self.analysis_filter(min_relevance, subreddit, theme)
+        sql = self.analysis_stats_sql(where)
+        return {
+            "total": connection.execute(sql["total"], params).fetchone()[0],
+            "theme_frequency": {theme: count for theme, count in connection.execute(sql["themes"], params) if theme},
+            "relevance_distribution": {bucket: count for bucket, count in connection.execute(sql["relevance"], params)},
+            "subreddit_counts": {name: count for name, count in connection.execute(sql["subreddits"], params) if name},
+        }
+
+    async def analysis_stats(self, min_relevance: Optional[float] = None, subreddit: Optional[str] = None,
+                             theme: Optional[str] = None) -> Dict[str, Any]:
+        return await self._run(self._analysis_stats, min_relevance, subreddit, theme)
+
+    # Trend rollups
+    def _increment_rollups(self, changes: Dict[tuple, Dict[str, float]]):
+        rows = [
+            (theme, subreddit, day, field_name, value)
+            for (theme, subreddit, day), increments in changes.items()
+            for field_name, value in increments.items()
+            if value
+        ]
+        connection = self._connect()
+        with connection:
+            connection.executemany(
+                "INSERT INTO trend_rollups (theme, subreddit, day, field, value) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(theme, subreddit, day, field) DO UPDATE SET value = value + excluded.value",
+                rows
+            )
+
+    async def increment_rollups(self, changes: Dict[tuple, Dict[str, float]]):
+        if changes:
+            await self._run(self._increment_rollups, changes)
+
+    def _clear_rollups(self):
+        connection = self._connect()
+        with connection:
+            connection.execute("DELETE FROM trend_rollups")
+
+    async def clear_rollups(self):
+        await self._run(self._clear_rollups)
+
+    @staticmethod
+    def rollup_totals_sql(field_count: int, subreddit: bool) -> str:
+        return (
+            "SELECT theme, subreddit, field, SUM(value) FROM trend_rollups WHERE day >= ? "
+            + ("AND subreddit = ? " if subreddit else "")
+            + f"AND field IN ({', '.join('?' * field_count)}) GROUP BY theme, subreddit, field"
+        )
+
+    def _rollup_totals(self, since_day: str, fields: List[str], subreddit: Optional[str]) -> List[Dict]:
+        params = [since_day] + ([subreddit] if subreddit else []) + list(fields)
+        totals: Dict[tuple, Dict] = {}
+        for theme, row_subreddit, field_name, value in self._connect().execute(
+                self.rollup_totals_sql(len(fields), bool(subreddit)), params):
+            row = totals.setdefault((theme, row_subreddit), {
+                "theme": theme, "subreddit": row_subreddit, **{name: 0 for name in fields}
+            })
+            row[field_name] = int(value) if float(value).is_integer() else value
+        return list(totals.values())
+
+    async def rollup_totals(self, since_day: str, fields: List[str], subreddit: Optional[str] = None) -> List[Dict]:
+        return await self._run(self._rollup_totals, since_day, fields, subreddit)
+
+    # Trend syntheses
+    def _save_synthesis(self, synthesis: Dict):
+        created_at = synthesis.get('created_at')
+        if isinstance(created_at, datetime):
+            created_at = created_at.astimezone(timezone.utc).isoformat()
+        connection = self._connect()
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO trend_syntheses (id, created_at, document) VALUES (?, ?, ?)",
+                               (synthesis['id'], created_at or "", encode_document(synthesis)))
+
+    async def save_synthesis(self, synthesis: Dict):
+        await self._run(self._save_synthesis, synthesis)
+
+    def _recent_syntheses(self, limit: int) -> List[Dict]:
+        rows = self._connect().execute(
+            "SELECT document FROM trend_syntheses ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [decode_document(row['document']) for row in rows]
+
+    async def recent_syntheses(self, limit: int) -> List[Dict]:
+        return await self._run(self._recent_syntheses, limit)
+
+    # Crawl state
+    def _load_crawl_states(self, subreddits: List[str]) -> List[Dict]:
+        rows = self._connect().execute(
+            f"SELECT document FROM crawl_state WHERE subreddit IN ({self._placeholders(len(subreddits))})", subreddits
+        ).fetchall()
+        return [decode_document(row['document']) for row in rows]
+
+    async def load_crawl_states(self, subreddits: List[str]) -> List[Dict]:
+        if not subreddits:
+            return []
+        return await self._run(self._load_crawl_states, list(subreddits))
+
+    def _save_crawl_state(self, state: Dict):
+        connection = self._connect()
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO crawl_state (subreddit, document) VALUES (?, ?)",
+                               (state['subreddit'], encode_document(state)))
+
+    async def save_crawl_state(self, state: Dict):
+        await self._run(self._save_crawl_state, state)
+
+    # Diagnostics
+    def diagnostic_queries(self) -> List[Tuple[str, str, str, List]]:
+        """(name, table, SQL, parameters) for a representative form of every query"""
+        threshold_where, threshold_params = self.analysis_filter(50.0)
+        subreddit_where, subreddit_params = self.analysis_filter(50.0, subreddit="diagnostic")
+        theme_where, theme_params = self.analysis_filter(50.0, theme="diagnostic")
+        queries = [
+            ("store_posts upsert", "reddit_posts", "SELECT id FROM reddit_posts WHERE id IN (?)", ["diagnostic"]),
+            ("search-reddit local search", "reddit_posts", self.search_sql(), ['"diagnostic"', 20]),
+            ("analyze-posts load analyses", "post_analyses", "SELECT post_id, document FROM post_analyses WHERE post_id IN (?)", ["diagnostic"]),
+            ("synthesize-trends rollup window", "trend_rollups", self.rollup_totals_sql(1, False), ["2024-01-01", "count"]),
+            ("synthesize-trends rollup window for a subreddit", "trend_rollups", self.rollup_totals_sql(1, True), ["2024-01-01", "diagnostic", "count"]),
+            ("trends newest first", "trend_syntheses", "SELECT document FROM trend_syntheses ORDER BY created_at DESC LIMIT ?", [10]),
+        ]
+        for label, where, params in (("", threshold_where, threshold_params),
+                                     (" for a subreddit", subreddit_where, subreddit_params),
+                                     (" for a theme", theme_where, theme_params)):
+            for statistic, sql in self.analysis_stats_sql(where).items():
+                queries.append((f"synthesize-trends {statistic}{label}", "post_analyses", sql, params))
+        for sort_by, column in self.sort_fields.items():
+            for subreddit in (None, "diagnostic"):
+                sql, params = self.posts_page_sql(column, 51, subreddit=subreddit)
+                queries.append((f"posts sorted by {sort_by}{' in subreddit' if subreddit else ''}", "reddit_posts", sql, params))
+        return queries
+
+    def _query_plans(self) -> List[Dict[str, Any]]:
+        connection = self._connect()
+        queries = []
+        for name, table, sql, params in self.diagnostic_queries():
+            report: Dict[str, Any] = {"name": name, "collection": table}
+            try:
+                details = [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+                report.update({
+                    "stages": details,
+                    "indexes_used": sorted({
+                        match for detail in details
+                        for match in re.findall(r"USING (?:COVERING )?INDEX (\w+)", detail)
+                    }),
+                    # A bare "SCAN table" reads every row; index and FTS scans name their access path
+                    "collscan": any(detail.startswith("SCAN") and "USING" not in detail and "VIRTUAL TABLE" not in detail
+                                    for detail in details),
+                })
+            except sqlite3.Error as e:
+                report["error"] = str(e)
+            queries.append(report)
+        return queries
+
+    async def query_plans(self) -> List[Dict[str, Any]]:
+        return await self._run(self._query_plans)
@@ -0,0 +1,56 @@
+"""Shared test setup.
+
+The app runs against a throwaway SQLite database, and its scrapers talk to
+an in-process FakeReddit (benchmarks.fake_reddit) over httpx's ASGI
+transport, so nothing touches the network. Both upstream base URLs point at
+the same host, as they do when benchmarking against the fake server.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Read once when server is imported, so set before any test module imports it
+os.environ["STORAGE_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="reddit-tests-"), "reddit.db")
+os.environ["REDDIT_BASE_URL"] = "http://fake-reddit.test"
+os.environ["PUSHSHIFT_BASE_URL"] = "http://fake-reddit.test"
+os.environ["REDDIT_RATE_LIMIT"] = "1000"
+os.environ["REDDIT_RATE_BURST"] = "1000"
+os.environ["SCRAPER_MAX_REQUESTS"] = "100000"
+os.environ["CRAWLER_ENABLED"] = "false"
+os.environ["SCRAPE_CACHE_PERSIST"] = "false"
+os.environ["PROFILE_ADMIN_TOKEN"] = "test-profile-token"
+
+import server  # noqa: E402
+from benchmarks.fake_reddit import FakeReddit  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def fake_reddit():
+    return FakeReddit(keywords=["sleep", "longevity"], fixtures_dir=None, latency=0.0, jitter=0.0)
+
+
+@pytest.fixture
+async def api(fake_reddit):
+    """A client for the app, started through its lifespan on an empty database"""
+    async with server.app.router.lifespan_context(server.app):
+        await server.storage.reset()
+        await server.scrape_cache.clear()
+        server.endpoint_health.clear()
+        await server.http_pool.client.aclose()
+        server.http_pool.client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=fake_reddit.app), headers=server.REDDIT_HEADERS
+        )
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://test") as client:
+            yield client
@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+import server
+from benchmarks.corpus import synthetic_corpus
+
+pytestmark = pytest.mark.anyio
+
+
+async def seed_posts(count: int):
+    posts = synthetic_corpus(count, ["sleep", "longevity", "Biohackers"], ["sleep", "wearable", "longevity"], seed=7)
+    await server.store_posts([server.RedditPost(**post) for post in posts])
+    return [post["id"] for post in posts]
+
+
+async def rollup_stats():
+    return await server.aggregate_rollup_stats("2000-01-01", None)
+
+
+async def test_concurrent_reanalysis_keeps_rollups_equal_to_a_rebuild(api):
+    post_ids = await seed_posts(40)
+    request = {"post_ids": post_ids, "incremental": False}
+    responses = await asyncio.gather(*(api.post("/api/analyze-posts", json=request) for _ in range(3)))
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    
+    incremental = await rollup_stats()
+    assert incremental["total"] == 40
+    await server.rebuild_rollups()
+    assert incremental == await rollup_stats()
+
+
+async def test_incremental_analysis_reuses_matching_fingerprints(api):
+    post_ids = await seed_posts(10)
+    first = (await api.post("/api/analyze-posts", json={"post_ids": post_ids})).json()
+    second = (await api.post("/api/analyze-posts", json={"post_ids": post_ids})).json()
+    assert (first["recomputed"], second["reused"]) == (10, 10)
+    assert (await rollup_stats())["total"] == 10
@@ -0,0 +1,111 @@
+import json
+
+import anyio
+import httpx
+import pytest
+
+import server
+from benchmarks.corpus import listing_payload, pushshift_payload, synthetic_corpus
+from benchmarks.fake_reddit import FakeReddit, FakeRedditServer
+
+pytestmark = pytest.mark.anyio
+
+BASE_URL = "http://fake-reddit.test"
+
+
+def fake_client(fake: FakeReddit) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app), base_url=BASE_URL)
+
+
+def test_corpus_is_deterministic_per_seed():
+    first = synthetic_corpus(20, ["sleep", "yoga"], ["wearable"], seed=4)
+    assert first == synthetic_corpus(20, ["sleep", "yoga"], ["wearable"], seed=4)
+    assert first != synthetic_corpus(20, ["sleep", "yoga"], ["wearable"], seed=5)
+    assert len({post["id"] for post in first}) == 20
+    assert {post["subreddit"] for post in first} <= {"sleep", "yoga"}
+    assert all(server.RedditPost(**post) for post in first)
+
+
+def test_payloads_parse_back_into_the_corpus_posts():
+    posts = synthetic_corpus(5, ["sleep"], ["wearable"], seed=1)
+    keys = ("id", "title", "content", "author", "upvotes", "comments_count", "created_at")
+    expected = [{key: post[key] for key in keys} for post in posts]
+    
+    listing = listing_payload(posts, after="t3_next")
+    assert listing["data"]["after"] == "t3_next"
+    parsed = server.parse_listing_posts(listing, "sleep")
+    assert [{key: post[key] for key in keys} for post in parsed] == expected
+    assert [post["url"] for post in parsed] == [post["url"] for post in posts]
+    
+    parsed = server.parse_pushshift_posts(pushshift_payload(posts), "sleep")
+    assert [{key: post[key] for key in keys} for post in parsed] == expected
+
+
+@pytest.mark.parametrize("path, kind, subreddit", [
+    ("/r/sleep/search.json?q=sleep&restrict_sr=1&limit=4", "search", "sleep"),
+    ("/search.json?q=sleep+subreddit:yoga&limit=4", "global_search", "yoga"),
+    ("/r/sleep/hot.json?limit=4", "hot", "sleep"),
+    ("/r/sleep.json?limit=4", "hot", "sleep"),
+    ("/r/sleep/new.json?limit=4&raw_json=1", "new", "sleep"),
+    ("/r/sleep/top.json?t=week&limit=4", "top", "sleep"),
+])
+async def test_fake_reddit_serves_every_scraped_listing(path, kind, subreddit):
+    fake = FakeReddit(fixtures_dir=None, latency=0.0, jitter=0.0)
+    async with fake_client(fake) as client:
+        first = (await client.get(path)).json()
+        second = (await client.get(path)).json()
+    children = first["data"]["children"]
+    assert len(children) == 4
+    assert {child["data"]["subreddit"] for child in children} == {subreddit}
+    assert first == second
+    assert fake.requests == {kind: 2}
+
+
+async def test_fake_reddit_serves_pushshift_searches():
+    fake = FakeReddit(fixtures_dir=None, latency=0.0, jitter=0.0)
+    async with fake_client(fake) as client:
+        response = await client.get("/reddit/search/submission/", params={"subreddit": "sleep", "q": "sleep", "size": 3})
+    posts = server.parse_pushshift_posts(response.json(), "sleep")
+    assert len(posts) == 3
+    assert fake.requests == {"pushshift": 1}
+
+
+async def test_fake_reddit_error_rates_are_per_upstream():
+    fake = FakeReddit(fixtures_dir=None, latency=0.0, jitter=0.0, error_rate=1.0, pushshift_error_rate=0.0)
+    async with fake_client(fake) as client:
+        reddit = await client.get("/r/sleep/hot.json")
+        pushshift = await client.get("/reddit/search/submission/", params={"subreddit": "sleep"})
+    assert (reddit.status_code, pushshift.status_code) == (503, 200)
+    assert fake.errors == {"hot": 1}
+
+
+async def test_fake_reddit_replays_recorded_fixtures(tmp_path):
+    recorded = listing_payload(synthetic_corpus(2, ["sleep"], [], seed=9, prefix="recorded"))
+    (tmp_path / "hot__sleep.json").write_text(json.dumps(recorded))
+    fake = FakeReddit(fixtures_dir=tmp_path, latency=0.0, jitter=0.0)
+    async with fake_client(fake) as client:
+        assert (await client.get("/r/Sleep/hot.json")).json() == recorded
+        assert (await client.get("/r/yoga/hot.json")).json() != recorded
+
+
+def test_fake_reddit_server_listens_on_a_free_port():
+    with FakeRedditServer(FakeReddit(fixtures_dir=None, latency=0.0, jitter=0.0)) as fake_server:
+        assert fake_server.port != 0
+        response = httpx.get(f"{fake_server.url}/r/sleep/hot.json?limit=2")
+    assert response.status_code == 200
+    assert len(response.json()["data"]["children"]) == 2
+
+
+async def test_reddit_and_pushshift_limiters_stay_apart_on_a_shared_host(api):
+    assert server.REDDIT_BASE_URL == server.PUSHSHIFT_BASE_URL
+    assert server.get_rate_limiter("reddit") is not server.get_rate_limiter("pushshift")
+    
+    # A search that never needs Pushshift isn't slowed by a blocked Pushshift bucket
+    pushshift = server.get_rate_limiter("pushshift")
+    pushshift.blocked_until = float("inf")
+    try:
+        with anyio.fail_after(10):
+            response = await api.post("/api/search-reddit", json={"query": "sleep", "max_posts": 20})
+    finally:
+        pushshift.blocked_until = 0.0
+    assert response.status_code == 200 and response.json()["posts"]
@@ -0,0 +1,123 @@
+from datetime import timedelta
+
+import pytest
+
+import server
+from benchmarks.corpus import EPOCH, listing_payload, synthetic_corpus
+
+pytestmark = pytest.mark.anyio
+
+
+class ListingScraper:
+    """Serves r/<subreddit>/new.json pages, newest first, from an in-memory list"""
+
+    def __init__(self):
+        self.posts = []
+        self.published = 0
+
+    def publish(self, count: int):
+        start = self.published
+        self.published += count
+        for index, post in enumerate(synthetic_corpus(count, ["sleep"], ["sleep"], seed=start, prefix="crawl")):
+            number = start + index
+            post.update({"id": f"crawl{number:04d}", "created_at": str(EPOCH + timedelta(minutes=number))})
+            self.posts.append(post)
+
+    async def scrape_subreddit_new(self, subreddit, limit, after=None):
+        newest_first = list(reversed(self.posts))
+        fullnames = [f"t3_{post['id']}" for post in newest_first]
+        if after is not None and after not in fullnames:
+            # Reddit's answer to a cursor whose post is gone
+            return listing_payload([])
+        start = 0 if after is None else fullnames.index(after) + 1
+        page = newest_first[start:start + limit]
+        more = start + limit < len(newest_first)
+        return listing_payload(page, after=f"t3_{page[-1]['id']}" if page and more else None)
+
+
+async def stored_ids(scraper):
+    return set(await server.load_posts_by_ids([post["id"] for post in scraper.posts]))
+
+
+async def test_crawler_resumes_a_backlog_deeper_than_one_poll(api, monkeypatch):
+    monkeypatch.setattr(server, "CRAWLER_PAGE_SIZE", 5)
+    monkeypatch.setattr(server, "CRAWLER_MAX_PAGES", 2)
+    scraper = ListingScraper()
+    crawler = server.SubredditCrawler(["sleep"])
+    state = {"subreddit": "sleep", "interval_seconds": server.CRAWLER_MIN_INTERVAL, "total_posts": 0}
+    
+    scraper.publish(3)
+    assert await crawler.crawl(scraper, state) == 3
+    assert state["last_fullname"] == "t3_crawl0002"
+    
+    # 23 new posts: more than the 10 one poll may page through
+    scraper.publish(23)
+    assert await crawler.crawl(scraper, state) == 10
+    assert state["last_fullname"] == "t3_crawl0002"
+    assert state["resume_after"] == "t3_crawl0016"
+    assert state["backlog_fullname"] == "t3_crawl0025"
+    
+    scraper.publish(2)
+    assert await crawler.crawl(scraper, state) == 10
+    assert await crawler.crawl(scraper, state) == 3
+    assert state["last_fullname"] == "t3_crawl0025"
+    assert "resume_after" not in state and "backlog_fullname" not in state
+    
+    # Posts published while the backlog was drained come next
+    assert await crawler.crawl(scraper, state) == 2
+    assert state["last_fullname"] == "t3_crawl0027"
+    assert await stored_ids(scraper) == {post["id"] for post in scraper.posts}
+    assert (await server.storage.load_crawl_states(["sleep"]))[0]["last_fullname"] == "t3_crawl0027"
+
+
+async def test_crawler_keeps_its_place_when_a_page_fails(api, monkeypatch):
+    monkeypatch.setattr(server, "CRAWLER_PAGE_SIZE", 5)
+    scraper = ListingScraper()
+    crawler = server.SubredditCrawler(["sleep"])
+    state = {"subreddit": "sleep", "interval_seconds": server.CRAWLER_MIN_INTERVAL, "total_posts": 0}
+    scraper.publish(1)
+    await crawler.crawl(scraper, state)
+    scraper.publish(12)
+    
+    pages = scraper.scrape_subreddit_new
+    
+    async def second_page_fails(subreddit, limit, after=None):
+        return None if after else await pages(subreddit, limit, after)
+    
+    scraper.scrape_subreddit_new = second_page_fails
+    assert await crawler.crawl(scraper, state) == 5
+    assert state["last_fullname"] == "t3_crawl0000"
+    
+    scraper.scrape_subreddit_new = pages
+    assert await crawler.crawl(scraper, state) == 7
+    assert state["last_fullname"] == "t3_crawl0012"
+    assert await stored_ids(scraper) == {post["id"] for post in scraper.posts}
+
+
+async def test_crawler_restarts_from_the_top_when_its_cursor_is_gone(api, monkeypatch):
+    monkeypatch.setattr(server, "CRAWLER_PAGE_SIZE", 5)
+    monkeypatch.setattr(server, "CRAWLER_MAX_PAGES", 2)
+    scraper = ListingScraper()
+    crawler = server.SubredditCrawler(["sleep"])
+    state = {"subreddit": "sleep", "interval_seconds": server.CRAWLER_MIN_INTERVAL, "total_posts": 0}
+    scraper.publish(1)
+    await crawler.crawl(scraper, state)
+    
+    scraper.publish(14)
+    assert await crawler.crawl(scraper, state) == 10
+    assert state["resume_after"] == "t3_crawl0005"
+    high_water = state["last_created_utc"]
+    
+    # The post under the cursor is deleted: the next poll gets an empty page for it
+    scraper.posts = [post for post in scraper.posts if post["id"] != "crawl0005"]
+    scraper.publish(1)
+    # The empty page used one of the poll's two requests; one page from the top is left
+    assert await crawler.crawl(scraper, state) == 5
+    assert state["last_created_utc"] == high_water
+    assert state["resume_after"] == "t3_crawl0011"
+    assert state["backlog_fullname"] == "t3_crawl0015"
+    
+    assert await crawler.crawl(scraper, state) == 9
+    assert state["last_fullname"] == "t3_crawl0015"
+    assert "resume_after" not in state
+    assert await stored_ids(scraper) == {post["id"] for post in scraper.posts}
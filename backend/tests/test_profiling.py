@@ -0,0 +1,58 @@
+import pytest
+
+import server
+from profiling import ProfileStore
+
+pytestmark = pytest.mark.anyio
+
+TOKEN = {"X-Profile-Token": "test-profile-token"}
+
+
+class StreamedResponse:
+    status_code = 200
+
+    def __init__(self, chunks):
+        async def body():
+            for chunk in chunks:
+                yield chunk
+        self.body_iterator = body()
+
+
+async def test_streamed_body_is_profiled_until_exhausted():
+    store = ProfileStore(history=5)
+    
+    async def call():
+        return StreamedResponse([b"one", b"two"])
+    
+    response = await store.profile("r1", "GET", "/stream", call)
+    assert store.get("r1") is None
+    assert [chunk async for chunk in response.body_iterator] == [b"one", b"two"]
+    assert store.get("r1")["status"] == 200
+    
+    # The next request is profiled once the first body has been sent
+    response = await store.profile("r2", "GET", "/stream", call)
+    assert [chunk async for chunk in response.body_iterator] == [b"one", b"two"]
+    assert [profile["request_id"] for profile in store.list()] == ["r2", "r1"]
+
+
+async def test_failed_call_is_profiled_and_releases_the_store():
+    store = ProfileStore(history=5)
+    
+    async def call():
+        raise RuntimeError("boom")
+    
+    with pytest.raises(RuntimeError):
+        await store.profile("r1", "GET", "/fails", call)
+    assert store.get("r1")["status"] is None
+    assert not store._lock.locked()
+
+
+async def test_stream_endpoint_profile_covers_the_scrape(api):
+    server.profile_store.clear()
+    response = await api.get("/api/search-reddit/stream", params={"query": "sleep", "max_posts": 10}, headers=TOKEN)
+    assert response.status_code == 200 and "event: done" in response.text
+    
+    profile = (await api.get(f"/api/admin/profiles/{response.headers['X-Request-ID']}", headers=TOKEN)).json()
+    # Scraping and storing happen while the body streams, after the headers were sent
+    assert profile["focus_seconds"]["scraper"] > 0
+    assert profile["focus_seconds"]["storage"] > 0
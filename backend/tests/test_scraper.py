@@ -0,0 +1,75 @@
+from collections import deque
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def small_budget(monkeypatch):
+    """Shrink the process-wide request budget to a handful of requests"""
+    monkeypatch.setattr(server.request_budget, "limit", 6)
+    monkeypatch.setattr(server.request_budget, "_issued", deque())
+    return server.request_budget
+
+
+async def test_request_budget_is_shared_between_scrapers(api):
+    budget = server.RequestBudget(3, 60)
+    first = server.AsyncRedditScraper(budget=budget)
+    second = server.AsyncRedditScraper(budget=budget)
+    url = f"{server.REDDIT_BASE_URL}/r/sleep/hot.json?limit=2"
+    assert (await first._get(url)).status_code == 200
+    assert (await second._get(url)).status_code == 200
+    assert (await first._get(url)).status_code == 200
+    assert await second._get(url) is None
+    assert budget.snapshot()["refused"] == 1
+
+
+async def test_search_reports_subreddits_skipped_by_the_budget(api, small_budget):
+    response = await api.post("/api/search-reddit", json={"query": "sleep", "max_posts": 20, "mode": "live"})
+    assert response.status_code == 200
+    body = response.json()
+    skipped = body["budget_skipped_subreddits"]
+    assert skipped and set(skipped) <= set(server.TARGET_SUBREDDITS)
+
+
+async def test_search_job_progress_marks_budget_skipped_subreddits(api, small_budget):
+    job = server.scrape_jobs.submit(server.SearchRequest(query="sleep", max_posts=20))
+    await server.scrape_jobs.queue.join()
+    assert job.status == "completed"
+    assert job.budget_skipped_subreddits
+    for subreddit in job.budget_skipped_subreddits:
+        assert job.progress[subreddit]["status"] == "budget_exhausted"
+    assert job.subreddits_done == len(server.TARGET_SUBREDDITS)
+
+
+def trip_circuit(health, subreddit, endpoint):
+    """Open `endpoint`'s circuit, then let its cool-down run out"""
+    for _ in range(health.failure_threshold):
+        health.record(subreddit, endpoint, False, 5.0, hard_failure=True)
+    health._stats[health._key(subreddit, endpoint)].open_until = 0.0
+
+
+async def test_half_open_probe_is_claimed_only_by_a_request_that_goes_out(api):
+    health = server.endpoint_health
+    trip_circuit(health, "sleep", "pushshift")
+    assert "pushshift" in health.order("sleep", ["subreddit_search", "global_search", "pushshift"])
+
+    posts = await server.AsyncRedditScraper()._fetch_subreddit_search("sleep", "sleep")
+    assert posts
+    # The chain stopped at its first link: the fallback's probe is still there
+    pushshift = next(entry for entry in health.snapshot() if entry["endpoint"] == "pushshift")
+    assert not pushshift["circuit_open"]
+    assert "pushshift" in health.order("sleep", ["pushshift"])
+    assert health.claim("sleep", "pushshift")
+    assert not health.claim("sleep", "pushshift")
+
+
+def test_fast_failing_shared_endpoint_does_not_jump_the_chain():
+    health = server.EndpointHealth(0.3, 3, 300, 3600)
+    for _ in range(2):
+        health.record("sleep", "pushshift", False, 0.01, hard_failure=True)
+    endpoints = ["subreddit_search", "global_search", "pushshift"]
+    assert health.order("insomnia", endpoints) == endpoints
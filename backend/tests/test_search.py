@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+from benchmarks.corpus import synthetic_corpus
+
+pytestmark = pytest.mark.anyio
+
+
+async def seed_sleep_posts(count: int, scraped_at: datetime):
+    posts = synthetic_corpus(count, ["sleep"], [], seed=3, prefix="stored")
+    for index, post in enumerate(posts):
+        post["title"] = f"Sleep tracking question {index}"
+    await server.store_posts([server.RedditPost(**post, scraped_at=scraped_at) for post in posts])
+
+
+async def search(api, mode: str):
+    response = await api.post("/api/search-reddit", json={"query": "sleep tracking", "max_posts": 10, "mode": mode})
+    assert response.status_code == 200
+    return response.json()
+
+
+async def test_auto_search_answers_from_fresh_stored_posts(api):
+    await seed_sleep_posts(10, datetime.now(timezone.utc))
+    body = await search(api, "auto")
+    assert body["source"] == "local"
+    assert len(body["posts"]) == 10
+    assert all(post["text_score"] > 0 for post in body["posts"])
+
+
+async def test_auto_search_scrapes_when_stored_posts_are_stale(api):
+    await seed_sleep_posts(10, datetime.now(timezone.utc) - timedelta(seconds=server.LOCAL_SEARCH_MAX_AGE + 60))
+    body = await search(api, "auto")
+    assert body["source"] == "live"
+    assert body["fallback_reason"].startswith("newest stored match is")
+
+
+async def test_local_search_never_scrapes(api, fake_reddit):
+    await seed_sleep_posts(2, datetime.now(timezone.utc) - timedelta(days=30))
+    body = await search(api, "local")
+    assert body["source"] == "local" and len(body["posts"]) == 2
+    assert sum(fake_reddit.requests.values()) == 0
@@ -0,0 +1,230 @@
+"""Both storage backends against the same expectations: SQLite on a scratch
+file, and MongoStorage on mongomock (which has no $text search)"""
+import asyncio
+
+import pytest
+
+import server
+import storage as storage_module
+from storage import MongoStorage, SQLiteStorage
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(params=["sqlite", "mongo"])
+async def backend(request, tmp_path, monkeypatch):
+    if request.param == "sqlite":
+        storage = SQLiteStorage(str(tmp_path / "storage.db"), server.POSTS_SORT_FIELDS, server.RELEVANCE_BUCKETS,
+                                server.LOCAL_SEARCH_TITLE_WEIGHT)
+    else:
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+        storage = MongoStorage(mongomock_motor.AsyncMongoMockClient()["storage_tests"], server.POSTS_SORT_FIELDS,
+                               server.RELEVANCE_BUCKETS, server.LOCAL_SEARCH_TITLE_WEIGHT)
+    await storage.setup()
+    # The module-level helpers (store_analyses, rebuild_rollups, ...) go through server.storage
+    monkeypatch.setattr(server, "storage", storage)
+    yield storage
+    await storage.close()
+
+
+def post(post_id: str, title: str = "A post", content: str = "", upvotes: int = 1, subreddit: str = "sleep"):
+    return server.RedditPost(id=post_id, title=title, content=content, subreddit=subreddit, author="someone",
+                             upvotes=upvotes, comments_count=0, url=f"https://www.reddit.com/{post_id}",
+                             created_at="2024-01-01 00:00:00+00:00").dict()
+
+
+async def page_through(storage, sort_field: str, limit: int):
+    """Every post in list_posts order, fetched `limit` at a time through the (value, id) cursor"""
+    pages, after = [], None
+    while True:
+        page = await storage.list_posts(sort_field, limit, after=after)
+        pages.append([item["id"] for item in page])
+        if len(page) < limit:
+            return pages
+        after = (page[-1].get(sort_field), page[-1]["id"])
+
+
+async def test_upsert_counts_and_keeps_the_first_scrape(backend):
+    assert await backend.upsert_posts([post("a"), post("b")]) == {"inserted": 2, "updated": 0}
+    refreshed = {**post("a", title="Edited", upvotes=9), "scraped_at": "2030-01-01T00:00:00+00:00"}
+    assert await backend.upsert_posts([refreshed, post("b")]) == {"inserted": 0, "updated": 1}
+    stored = (await backend.get_posts(["a"]))["a"]
+    assert (stored["title"], stored["upvotes"]) == ("A post", 9)
+    assert not str(stored["scraped_at"]).startswith("2030")
+
+
+async def test_cursor_paging_puts_posts_without_a_score_last(backend):
+    await backend.upsert_posts([post(f"p{index}") for index in range(7)])
+    await backend.set_post_relevance({"p1": 50.0, "p2": 80.0, "p4": 50.0, "p6": 10.0})
+    expected = ["p2", "p4", "p1", "p6", "p5", "p3", "p0"]
+    
+    assert [item["id"] for item in await backend.list_posts("relevance_score", 10)] == expected
+    for limit in (1, 2, 3):
+        pages = await page_through(backend, "relevance_score", limit)
+        assert [post_id for page in pages for post_id in page] == expected
+
+
+async def test_posts_endpoint_pages_through_unscored_posts(api, backend):
+    await backend.upsert_posts([post(f"p{index}") for index in range(5)])
+    await backend.set_post_relevance({"p0": 40.0, "p3": 40.0})
+    seen, cursor = [], None
+    while True:
+        params = {"sort_by": "relevance", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        body = (await api.get("/api/posts", params=params)).json()
+        seen.extend(item["id"] for item in body["posts"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ["p3", "p0", "p4", "p2", "p1"]
+
+
+async def test_posts_after_a_cursor(backend):
+    await backend.upsert_posts([post(f"p{index}") for index in range(6)])
+    await backend.set_post_relevance({"p1": 50.0, "p3": 50.0, "p5": 70.0})
+    
+    async def after(value, post_id):
+        return [item["id"] for item in await backend.list_posts("relevance_score", 10, after=(value, post_id))]
+    
+    # Ties on the value continue by descending ID, then lower values, then posts without one
+    assert await after(70.0, "p5") == ["p3", "p1", "p4", "p2", "p0"]
+    assert await after(50.0, "p3") == ["p1", "p4", "p2", "p0"]
+    assert await after(50.0, "p1") == ["p4", "p2", "p0"]
+    # Past the last scored post only unscored ones with a lower ID remain
+    assert await after(None, "p4") == ["p2", "p0"]
+    assert await after(None, "p0") == []
+
+
+async def test_list_posts_filters_and_attaches_analyses(backend):
+    await backend.upsert_posts([post("a", subreddit="sleep"), post("b", subreddit="yoga"), post("c", subreddit="sleep")])
+    await backend.set_post_relevance({"a": 90.0, "b": 95.0, "c": 20.0})
+    await backend.save_analyses([{"post_id": "a", "subreddit": "sleep", "relevance_score": 90.0}])
+    listed = await backend.list_posts("relevance_score", 10, subreddit="sleep", min_relevance=50.0)
+    assert [item["id"] for item in listed] == ["a"]
+    assert listed[0]["analysis"]["relevance_score"] == 90.0
+    assert (await backend.list_posts("upvotes", 10, subreddit="yoga"))[0]["analysis"] is None
+
+
+async def test_search_ranks_title_matches_first(backend):
+    if isinstance(backend, MongoStorage):
+        pytest.skip("mongomock does not implement $text search")
+    await backend.upsert_posts([
+        post("body", title="Morning routine", content="my sleep tracker says I sleep badly"),
+        post("title", title="Sleep tracker recommendations", content="which one do you use"),
+        post("both", title="Sleep tracker data", content="sleep tracker numbers after a month"),
+        post("none", title="Knee pain", content="running every day"),
+    ])
+    hits = await backend.search_posts("sleep tracker", 10)
+    assert [hit["id"] for hit in hits] == ["both", "title", "body"]
+    scores = [hit["text_score"] for hit in hits]
+    assert scores == sorted(scores, reverse=True) and scores[-1] > 0
+    assert [hit["id"] for hit in await backend.search_posts("sleep tracker", 1)] == ["both"]
+    assert await backend.search_posts("!!!", 10) == []
+
+
+def analysis(post_id: str, score: float, themes=(), subreddit: str = "sleep", day: str = "2024-01-02"):
+    return server.PostAnalysis(post_id=post_id, subreddit=subreddit, relevance_score=score, detected_themes=list(themes),
+                               post_day=day, upvotes=3, comments_count=1, takeaways=[], suggested_response="",
+                               targeting_insights="")
+
+
+async def test_rollup_increments_match_a_rebuild(backend):
+    await server.store_analyses([
+        analysis("a", 95, ["ai_personalization"]),
+        analysis("b", 30, ["ai_personalization", "sleep_optimization"], subreddit="yoga"),
+        analysis("c", 60, day="2023-06-01"),
+    ])
+    # Re-analysis moves a post between buckets, themes and subreddits
+    await server.store_analyses([analysis("a", 40, ["sleep_optimization"], subreddit="yoga"), analysis("d", 75)])
+    await asyncio.gather(*(server.store_analyses([analysis("b", 85)]) for _ in range(3)))
+    
+    incremental = await server.aggregate_rollup_stats("2024-01-01")
+    assert incremental == {
+        "total": 3,
+        "theme_frequency": {"sleep_optimization": 1},
+        "relevance_distribution": {"25-50": 1, "70-90": 2},
+        "subreddit_counts": {"sleep": 2, "yoga": 1},
+    }
+    assert (await server.aggregate_rollup_stats("2024-01-01", "yoga"))["total"] == 1
+    assert (await server.aggregate_rollup_stats("2000-01-01"))["total"] == 4
+    
+    await server.rebuild_rollups()
+    assert await server.aggregate_rollup_stats("2024-01-01") == incremental
+    assert (await server.aggregate_rollup_stats("2000-01-01"))["total"] == 4
+
+
+async def test_analysis_stats_and_counts(backend):
+    await server.store_analyses([
+        analysis("a", 95, ["ai_personalization"]),
+        analysis("b", 55, ["ai_personalization", "sleep_optimization"], subreddit="yoga"),
+        analysis("c", 10),
+    ])
+    stats = await backend.analysis_stats(min_relevance=50)
+    assert stats == {
+        "total": 2,
+        "theme_frequency": {"ai_personalization": 2, "sleep_optimization": 1},
+        "relevance_distribution": {"90-100": 1, "50-70": 1},
+        "subreddit_counts": {"sleep": 1, "yoga": 1},
+    }
+    assert (await backend.analysis_stats(theme="sleep_optimization"))["total"] == 1
+    assert await backend.count_analyses(subreddit="sleep") == 2
+    assert await backend.count_analyses(theme="ai_personalization") == 2
+
+
+async def test_crawl_state_round_trip(backend):
+    state = {"subreddit": "sleep", "last_fullname": "t3_x", "last_created_utc": 12.5, "interval_seconds": 300}
+    await backend.save_crawl_state(state)
+    await backend.save_crawl_state({**state, "interval_seconds": 600})
+    assert await backend.load_crawl_states(["sleep", "yoga"]) == [{**state, "interval_seconds": 600}]
+
+
+@pytest.fixture
+async def mongo_backend(backend):
+    if not isinstance(backend, MongoStorage):
+        pytest.skip("revision-checked writes are specific to MongoStorage")
+    return backend
+
+
+async def test_mongo_saves_a_chunk_in_one_bulk_write(mongo_backend, monkeypatch):
+    writes = []
+    replace_analyses = mongo_backend._replace_analyses
+    
+    async def counting(operations):
+        writes.append(len(operations))
+        return await replace_analyses(operations)
+    
+    monkeypatch.setattr(mongo_backend, "_replace_analyses", counting)
+    await mongo_backend.save_analyses([{"post_id": f"p{index}", "relevance_score": 1.0} for index in range(50)])
+    previous = await mongo_backend.save_analyses([{"post_id": f"p{index}", "relevance_score": 2.0} for index in range(50)])
+    assert writes == [50, 50]
+    assert all(analysis == {"post_id": f"p{index}", "relevance_score": 1.0} for index, analysis in enumerate(previous))
+    assert "revision" not in (await mongo_backend.get_analyses(["p0"]))["p0"]
+
+
+async def test_mongo_retries_a_write_that_lost_a_race(mongo_backend, monkeypatch):
+    await mongo_backend.save_analyses([{"post_id": "a", "relevance_score": 1.0}, {"post_id": "b", "relevance_score": 1.0}])
+    reads = []
+    versioned_analyses = mongo_backend._versioned_analyses
+    
+    async def stale_first_read(post_ids):
+        reads.append(sorted(post_ids))
+        # The first read misses post a, as if it happened before a concurrent save
+        return {} if len(reads) == 1 else await versioned_analyses(post_ids)
+    
+    monkeypatch.setattr(mongo_backend, "_versioned_analyses", stale_first_read)
+    previous = await mongo_backend.save_analyses([{"post_id": "a", "relevance_score": 2.0}])
+    assert previous == [{"post_id": "a", "relevance_score": 1.0}]
+    assert reads == [["a"], ["a"]]
+    assert (await mongo_backend.get_analyses(["a"]))["a"]["relevance_score"] == 2.0
+
+
+async def test_mongo_gives_up_on_a_post_that_keeps_changing(mongo_backend, monkeypatch):
+    await mongo_backend.save_analyses([{"post_id": "a", "relevance_score": 1.0}])
+    
+    async def always_stale(post_ids):
+        return {}
+    
+    monkeypatch.setattr(mongo_backend, "_versioned_analyses", always_stale)
+    with pytest.raises(RuntimeError, match="after 5 attempts"):
+        await mongo_backend.save_analyses([{"post_id": "a", "relevance_score": 2.0}])
+    assert storage_module.ANALYSIS_SAVE_ATTEMPTS == 5
+    assert (await mongo_backend.get_analyses(["a"]))["a"]["relevance_score"] == 1.0
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def parse_events(body: str):
+    events = []
+    for message in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in message.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+async def stream(api, query: str = "sleep"):
+    response = await api.get("/api/search-reddit/stream", params={"query": query, "max_posts": 20})
+    assert response.status_code == 200
+    return parse_events(response.text)
+
+
+@pytest.fixture
+def analyzed_posts(monkeypatch):
+    """Records how many posts each run_post_analyses call had to score"""
+    calls = []
+    run_post_analyses = server.run_post_analyses
+    
+    async def counting(posts, profile, fingerprints):
+        calls.append(len(posts))
+        return await run_post_analyses(posts, profile, fingerprints)
+    
+    monkeypatch.setattr(server, "run_post_analyses", counting)
+    return calls
+
+
+async def test_stream_reuses_analyses_with_matching_fingerprints(api, analyzed_posts):
+    first = await stream(api)
+    posts = [data for event, data in first if event == "post"]
+    assert posts and sum(analyzed_posts) == len(posts)
+    
+    analyzed_posts.clear()
+    second = await stream(api)
+    assert sum(analyzed_posts) == 0
+    first_analyses = {data["post_id"]: data for event, data in first if event == "analysis"}
+    second_analyses = {data["post_id"]: data for event, data in second if event == "analysis"}
+    assert second_analyses == json.loads(json.dumps(first_analyses, default=str))
+
+
+async def test_stream_reports_storage_errors_and_keeps_going(api, monkeypatch):
+    async def failing_store_posts(posts):
+        raise RuntimeError("disk full")
+    
+    monkeypatch.setattr(server, "store_posts", failing_store_posts)
+    events = await stream(api)
+    errors = [data for event, data in events if event == "error"]
+    assert errors and all(error["detail"] == "disk full" for error in errors)
+    progress = [data for event, data in events if event == "subreddit"]
+    assert len(progress) == len(server.TARGET_SUBREDDITS)
+    assert all(data["error"] == "disk full" for data in progress if data["posts"])
+    assert events[-1][0] == "done"
@@ -0,0 +1,29 @@
+import server
+
+
+def test_community_insights_follow_the_aggregated_subreddit_counts():
+    counts = {"sleep": 3, "Biohackers": 5, "yoga": 1}
+    insights = server.generate_community_insights(counts)
+    assert list(insights) == ["r/Biohackers", "r/sleep", "r/yoga"]
+    assert insights["r/Biohackers"].startswith(server.COMMUNITY_PROFILES["biohackers"])
+    assert insights["r/Biohackers"].endswith("5 of 9 analyzed posts (56%).")
+    assert insights["r/sleep"].startswith(server.DEFAULT_COMMUNITY_PROFILE)
+
+
+def test_community_insights_keep_only_the_busiest_communities():
+    counts = {f"sub{index}": index for index in range(1, 10)}
+    insights = server.generate_community_insights(counts)
+    assert len(insights) == server.COMMUNITY_INSIGHTS_LIMIT
+    assert next(iter(insights)) == "r/sub9"
+    assert server.generate_community_insights({}) == {}
+
+
+def test_trend_synthesis_reports_communities_of_the_analyses():
+    analyses = [
+        {"subreddit": "longevity", "relevance_score": 80, "detected_themes": ["ai_personalization"]},
+        {"subreddit": "longevity", "relevance_score": 95, "detected_themes": []},
+        {"subreddit": "sleep", "relevance_score": 30, "detected_themes": []},
+    ]
+    synthesis = server.synthesize_trends_for_eon_health("sleep", analyses)
+    assert synthesis.subreddit_counts == {"longevity": 2, "sleep": 1}
+    assert list(synthesis.community_insights) == ["r/longevity", "r/sleep"]